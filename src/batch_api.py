@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import os
+from typing import Dict, List
+
+import polib
+from dotenv import load_dotenv
+from loguru import logger
+from openai.types import Batch
+
+from protect import mask
+from translation_memory import TranslationMemory, open_memory
+from translator import Translation, Translator, apply_translation, get_client, with_whitespace_of
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# The Batch API takes at most 50,000 requests per batch.
+MAX_BATCH_REQUESTS = 50_000
+
+
+def batch_request(translator: Translator, custom_id: str, text: str) -> dict:
+    """One line of the Batch API input file: the same request `translator` would send for `text`."""
+    if translator.protect:
+        messages = translator.messages(mask(text).text, protected=True)
+    else:
+        messages = translator.messages(text)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": translator.model,
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": translator.max_generated_tokens,
+        },
+    }
+
+
+async def submit_batch(translator: Translator, texts: List[str], input_path: str, first: int = 0) -> str:
+    """Upload one request per text and start a batch; returns the batch ID.
+
+    Requests are numbered from `first`, so answers of several batches for one
+    file don't collide.
+    """
+    with open(input_path, "w", encoding="utf-8") as input_file:
+        for position, text in enumerate(texts, first):
+            input_file.write(json.dumps(batch_request(translator, f"text-{position}", text), ensure_ascii=False) + "\n")
+    with open(input_path, "rb") as input_file:
+        uploaded = await translator.client.files.create(file=input_file, purpose="batch")
+    os.remove(input_path)
+    batch = await translator.client.batches.create(
+        input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+    )
+    logger.info(f"Submitted batch {batch.id} with {len(texts)} requests")
+    return batch.id
+
+
+async def read_answers(translator: Translator, output_file_id: str) -> Dict[str, str]:
+    """Answers of a finished batch by custom_id; failed requests are left out."""
+    content = await translator.client.files.content(output_file_id)
+    answers = {}
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {result['custom_id']} failed: {result.get('error') or response}")
+            continue
+        body = response["body"]
+        translator.n_api_requests += 1
+        translator.token_usage_prompt += body["usage"]["prompt_tokens"]
+        translator.token_usage_generated += body["usage"]["completion_tokens"]
+        answers[result["custom_id"]] = body["choices"][0]["message"]["content"]
+    return answers
+
+
+async def translate_pofile_batch(
+    translator: Translator,
+    filepath: str,
+    output_path: str,
+    incremental: bool = False,
+    poll_interval: float = 60.0,
+    wait: bool = True,
+    max_requests: int = MAX_BATCH_REQUESTS,
+) -> int | None:
+    """Translate a .po file through the OpenAI Batch API.
+
+    Texts that need a request go into batches of up to `max_requests`, at
+    about half the token price of chat completions and with rate limits
+    handled by the server. The batch IDs are saved next to the output file,
+    so a later call, with `wait` off or after a restart, picks up the same
+    batches instead of submitting new ones. Answers are validated like
+    regular ones and only the failing or missing texts are retried through
+    chat completions.
+
+    Returns the number of entries translated, or None if `wait` is off and
+    a batch is still running.
+    """
+    source_pofile = polib.pofile(filepath)
+    if incremental:
+        entries = source_pofile.untranslated_entries() + source_pofile.fuzzy_entries()
+    else:
+        entries = list(source_pofile)
+
+    state_path = output_path + ".batch.json"
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+        logger.info(f"Resuming {len(state['batch_ids'])} batches for {filepath}")
+    else:
+        # Texts that need no request are kept in the state too, so a resumed
+        # run doesn't look them up (and count them) again.
+        state = {"batch_ids": [], "texts": [], "known": {}}
+        for normalized in dict.fromkeys(entry.msgid.strip() for entry in entries):
+            if not normalized:
+                continue
+            translation = translator.known_translation(normalized)
+            if translation is None:
+                state["texts"].append(normalized)
+            else:
+                state["known"][normalized] = translation
+
+    def save_state():
+        with open(state_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file, ensure_ascii=False)
+
+    texts = state["texts"]
+    # The state is saved after every batch, so a restart never submits one twice.
+    for first in range(len(state["batch_ids"]) * max_requests, len(texts), max_requests):
+        state["batch_ids"].append(
+            await submit_batch(translator, texts[first:first + max_requests], output_path + ".batch.jsonl", first)
+        )
+        save_state()
+
+    finished: Dict[str, Batch] = {}
+    while True:
+        for batch_id in state["batch_ids"]:
+            if batch_id in finished:
+                continue
+            batch = await translator.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            logger.info(
+                f"Batch {batch.id}: {batch.status}"
+                + (f", {counts.completed + counts.failed}/{counts.total} requests" if counts else "")
+            )
+            if batch.status in FINAL_STATUSES:
+                finished[batch_id] = batch
+        if len(finished) == len(state["batch_ids"]):
+            break
+        if not wait:
+            return None
+        await asyncio.sleep(poll_interval)
+
+    answers: Dict[str, str] = {}
+    for batch in finished.values():
+        if batch.output_file_id is None:
+            # Failed, expired or cancelled before any request succeeded: its
+            # texts are sent as chat completions below.
+            logger.warning(f"Batch {batch.id} ended with status {batch.status} and no results")
+            continue
+        answers.update(await read_answers(translator, batch.output_file_id))
+
+    known = {text: Translation(*translation) for text, translation in state["known"].items()}
+
+    async def merge(position: int, text: str):
+        answer = answers.get(f"text-{position}")
+        if answer is not None and translator.protect:
+            answer = mask(text).unmask(answer)
+        # Missing or broken answers go through the regular validation retries.
+        known[text] = await translator.validated(text, answer)
+        translator.remember(text, known[text])
+
+    await asyncio.gather(*(merge(position, text) for position, text in enumerate(texts)))
+
+    for entry in entries:
+        normalized = entry.msgid.strip()
+        if not normalized:
+            continue
+        translation = known.get(normalized)
+        if translation is None or not translation.text:
+            continue
+        apply_translation(entry, with_whitespace_of(entry.msgid, translation))
+
+    if incremental:
+        source_pofile.save(output_path)
+    else:
+        translated_pofile = polib.POFile()
+        translated_pofile.metadata = source_pofile.metadata
+        translated_pofile.extend(entries)
+        translated_pofile.save(output_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    logger.info(f"Translation completed and saved to {output_path}")
+    return len(entries)
+
+
+def main(argv: List[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Translate a .po file through the OpenAI Batch API.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="submit (or check on) the batch and exit; run again later to collect the results",
+    )
+    parser.add_argument("--memory", default=TranslationMemory.DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    async def run():
+        with open_memory(args.memory or None) as memory, Translator(
+            get_client(args.api_key), memory=memory
+        ) as translator:
+            return await translate_pofile_batch(
+                translator, args.input, args.output, args.incremental, args.poll_interval, not args.no_wait
+            )
+
+    result = asyncio.run(run())
+    if result is None:
+        print("Batch is still running, run the same command again later.")
+
+
+if __name__ == "__main__":
+    main()
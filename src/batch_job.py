@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from metrics import METRICS
+from pool import POOL
+from read_pot import translate_pofile_with, translator_stats
+from translation_memory import TranslationMemory, open_memory
+from translator import Translator
+
+
+def find_pofiles(source: str) -> tuple[str, List[str]]:
+    """Return the root that output paths are relative to, and the .po files under `source`."""
+    if os.path.isdir(source):
+        return source, sorted(glob.glob(os.path.join(source, "**", "*.po"), recursive=True))
+    paths = sorted(glob.glob(source, recursive=True))
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ""
+    return root, paths
+
+
+class Progress:
+    """Per-file and overall progress of a batch job, logged as files advance."""
+
+    def __init__(self, paths: List[str]):
+        self.files: Dict[str, tuple[int, int]] = {path: (0, 0) for path in paths}
+        self.finished = 0
+        self.started = time.time()
+
+    def update(self, path: str, done: int, total: int):
+        self.files[path] = (done, total)
+        logger.info(f"{path}: {done}/{total} entries | {self.summary()}")
+
+    def finish(self, path: str):
+        self.finished += 1
+        logger.info(f"Finished {path} | {self.summary()}")
+
+    def summary(self) -> str:
+        done = sum(file_done for file_done, _ in self.files.values())
+        total = sum(file_total for _, file_total in self.files.values())
+        return (
+            f"overall: {self.finished}/{len(self.files)} files, {done}/{total} entries seen so far, "
+            f"{time.time() - self.started:.0f}s elapsed"
+        )
+
+
+async def translate_directory(
+    source: str,
+    output_dir: str,
+    api_key: str,
+    batch_size: int = 5,
+    concurrency: int = 16,
+    requests_per_minute: int = 500,
+    tokens_per_minute: int = 200_000,
+    max_open_files: int = 8,
+    memory_path: str | None = TranslationMemory.DEFAULT_PATH,
+    incremental: bool = False,
+    pack_tokens: int = 0,
+    checkpoint: bool = True,
+) -> dict:
+    """Translate every .po file in a directory (recursively) or matching a glob.
+
+    Entries of all files go through one translator session, so they share
+    the worker pool, rate limits, deduplication and translation memory.
+    Several files are open at once so small ones don't leave the pool idle,
+    and each output file is written as soon as its own entries are done. The
+    directory layout is mirrored under `output_dir`.
+    """
+    root, paths = find_pofiles(source)
+    logger.info(f"Batch job with {len(paths)} files from {source}")
+    progress = Progress(paths)
+    open_files = asyncio.Semaphore(max_open_files)
+    failed: Dict[str, str] = {}
+
+    with open_memory(memory_path) as memory, POOL.lease(api_key) as client, Translator(
+        client,
+        concurrency=concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        memory=memory,
+        pack_tokens=pack_tokens,
+    ) as translator:
+
+        async def translate_file(path: str):
+            output_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), os.path.abspath(root)))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            async with open_files:
+                try:
+                    await translate_pofile_with(
+                        translator,
+                        path,
+                        output_path,
+                        batch_size,
+                        incremental,
+                        checkpoint,
+                        on_progress=lambda done, total: progress.update(path, done, total),
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to translate {path}: {e}")
+                    failed[path] = str(e)
+                    return
+            progress.finish(path)
+
+        await asyncio.gather(*(translate_file(path) for path in paths))
+
+    return {
+        "files": len(paths),
+        "failed": failed,
+        **translator_stats(translator),
+    }
+
+
+def main(argv: List[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Translate a directory or glob of .po files.")
+    parser.add_argument("source", help="directory (searched recursively) or glob of .po files")
+    parser.add_argument("output_dir")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests-per-minute", type=int, default=500)
+    parser.add_argument("--tokens-per-minute", type=int, default=200_000)
+    parser.add_argument("--max-open-files", type=int, default=8)
+    parser.add_argument("--memory", default=TranslationMemory.DEFAULT_PATH)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--pack-tokens", type=int, default=0)
+    parser.add_argument("--no-checkpoint", action="store_true")
+    parser.add_argument("--metrics-file", help="write request metrics here (Prometheus text, or JSON for .json)")
+    args = parser.parse_args(argv)
+
+    # Log from a background thread so slow terminals don't stall the event loop.
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", enqueue=True)
+
+    result = asyncio.run(
+        translate_directory(
+            args.source,
+            args.output_dir,
+            args.api_key,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            max_open_files=args.max_open_files,
+            memory_path=None if args.no_memory else args.memory,
+            incremental=args.incremental,
+            pack_tokens=args.pack_tokens,
+            checkpoint=not args.no_checkpoint,
+        )
+    )
+    print(json.dumps(result, indent=2))
+    if args.metrics_file:
+        METRICS.dump(args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Iterator, List
+
+import polib
+from loguru import logger
+
+from estimator import MODEL_PRICES
+from mock_client import MockAsyncOpenAI
+from read_pot import translate_pofile_streaming, translate_pofile_with
+from translator import Translator
+
+WORDS = [
+    "the", "function", "derivative", "of", "a", "line", "slope", "is", "graph", "value",
+    "find", "point", "equal", "to", "number", "area", "triangle", "angle", "we", "know",
+]
+SHORT_TEXTS = ["Check", "Hint", "Next question", "Show me", "Try again", "Correct!", "Practice"]
+GLOSSARY = "ENG,UKR\nfunction,функція\nderivative,похідна\nslope,нахил\ngraph,графік\ntriangle,трикутник\n"
+
+
+def iter_synthetic_texts(n_entries: int, seed: int = 0) -> Iterator[str]:
+    """Mix of repeated UI labels, prose and prose with inline LaTeX, like a course export."""
+    rng = random.Random(seed)
+    for i in range(n_entries):
+        kind = rng.random()
+        if kind < 0.2:
+            yield rng.choice(SHORT_TEXTS)
+            continue
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 40))).capitalize()
+        if kind < 0.6:
+            sentence += f" $\\dfrac{{{i}}}{{x^2 + {rng.randint(1, 9)}}}$."
+        yield f"{sentence} ({i})"
+
+
+def synthetic_texts(n_entries: int, seed: int = 0) -> List[str]:
+    return list(iter_synthetic_texts(n_entries, seed))
+
+
+def write_synthetic_pofile(path: str, n_entries: int, seed: int = 0):
+    # Written entry by entry, so large files don't inflate the memory peak of the run.
+    with open(path, "w", encoding="utf-8") as pofile:
+        pofile.write('msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=UTF-8\\n"\n"Language: uk\\n"\n')
+        for i, text in enumerate(iter_synthetic_texts(n_entries, seed)):
+            pofile.write(f'\n#: content.json:{i}\nmsgid "{polib.escape(text)}"\nmsgstr ""\n')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def make_translator(client: MockAsyncOpenAI, workdir: str, args: argparse.Namespace) -> Translator:
+    glossary_path = os.path.join(workdir, "glossary.csv")
+    with open(glossary_path, "w", encoding="utf-8") as glossary_file:
+        glossary_file.write(GLOSSARY)
+    return Translator(
+        client,
+        model=args.model,
+        spreadsheet_path=glossary_path,
+        concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        pack_tokens=args.pack_tokens,
+    )
+
+
+async def run_case(target: str, n_entries: int, args: argparse.Namespace) -> dict:
+    client = MockAsyncOpenAI(
+        latency=args.latency,
+        mean_latency=args.mean_latency,
+        rate_limit_probability=args.rate_limit_probability,
+        timeout_probability=args.timeout_probability,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        translator = make_translator(client, workdir, args)
+        if target in ("translate_pofile", "translate_pofile_streaming"):
+            input_path = os.path.join(workdir, "input.po")
+            write_synthetic_pofile(input_path, n_entries, args.seed)
+        else:
+            texts = synthetic_texts(n_entries, args.seed)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with translator:
+            if target == "translate_pofile":
+                await translate_pofile_with(
+                    translator, input_path, os.path.join(workdir, "output.po"), args.batch_size, checkpoint=False
+                )
+            elif target == "translate_pofile_streaming":
+                await translate_pofile_streaming(
+                    translator, input_path, os.path.join(workdir, "output.po"), args.batch_size, checkpoint=False
+                )
+            else:
+                await translator.translate_batch(texts)
+        elapsed = time.perf_counter() - started
+        if args.trace_memory:
+            _, memory_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            # Peak RSS of the process (KiB on Linux), without tracing overhead;
+            # each case runs in its own process, see run_isolated.
+            memory_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    input_price, output_price = MODEL_PRICES.get(args.model, MODEL_PRICES["gpt-4o-mini"])
+    return {
+        "target": target,
+        "entries": n_entries,
+        "seconds": round(elapsed, 3),
+        "entries_per_second": round(n_entries / elapsed, 1),
+        "requests": client.n_requests,
+        "rate_limited": client.n_rate_limited,
+        "timeouts": client.n_timeouts,
+        "latency_p50": round(percentile(client.latencies, 50), 4),
+        "latency_p99": round(percentile(client.latencies, 99), 4),
+        "memory_peak_mb": round(memory_peak / 2 ** 20, 1),
+        "prompt_tokens": client.prompt_tokens,
+        "completion_tokens": client.completion_tokens,
+        "simulated_cost": round(
+            (client.prompt_tokens * input_price + client.completion_tokens * output_price) / 1_000_000, 4
+        ),
+    }
+
+
+def _run_case_quietly(target: str, n_entries: int, args: argparse.Namespace) -> dict:
+    # Per-entry logging would dominate the measurement.
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    return asyncio.run(run_case(target, n_entries, args))
+
+
+def run_isolated(target: str, n_entries: int, args: argparse.Namespace) -> dict:
+    """Run one case in a fresh process, so its memory peak isn't an earlier case's."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_case_quietly, (target, n_entries, args))
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Offline throughput benchmark of the translation pipeline against a mock OpenAI backend."
+    )
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma separated entry counts")
+    parser.add_argument(
+        "--targets",
+        default="translate_pofile,translate_batch",
+        help="comma separated: translate_pofile, translate_pofile_streaming, translate_batch",
+    )
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--pack-tokens", type=int, default=0)
+    parser.add_argument("--requests-per-minute", type=int, default=1_000_000)
+    parser.add_argument("--tokens-per-minute", type=int, default=1_000_000_000)
+    parser.add_argument("--latency", default="lognormal", choices=["constant", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--mean-latency", type=float, default=0.02)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--timeout-probability", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="report the Python heap peak of each case with tracemalloc (slows the run down)",
+    )
+    parser.add_argument(
+        "--min-entries-per-second",
+        type=float,
+        default=0,
+        help="exit with an error if any case is slower, for use in CI",
+    )
+    args = parser.parse_args(argv)
+
+    failed = False
+    for target in args.targets.split(","):
+        for size in args.sizes.split(","):
+            result = run_isolated(target, int(size), args)
+            print(json.dumps(result))
+            if result["entries_per_second"] < args.min_entries_per_second:
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
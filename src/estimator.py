@@ -0,0 +1,222 @@
+import argparse
+import glob
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List
+
+from loguru import logger
+
+from po_stream import iter_entries
+from protect import mask
+from translation_memory import TranslationMemory, open_memory
+from translator import Translator
+
+# USD per 1M (input, output) tokens.
+MODEL_PRICES: Dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+# Ukrainian output takes noticeably more tokens than the English source.
+OUTPUT_TOKEN_RATIO = 1.6
+# JSON quoting and separators around every element of a packed request.
+PACKED_TEXT_OVERHEAD = 3
+
+
+@dataclass
+class Estimate:
+    entries: int = 0
+    unique_texts: int = 0
+    skipped: int = 0
+    cache_hits: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        result = asdict(self)
+        result["cost"] = round(self.cost, 4)
+        result["seconds"] = round(self.seconds, 1)
+        return result
+
+
+class Estimator:
+    """Predict requests, tokens, cost and duration of a translation without calling the API.
+
+    Mirrors what the translator would do with the same settings: duplicate
+    texts, pure formulas and translation memory hits are free, formulas are
+    masked before counting, short texts are packed when packing is on, and
+    only the relevant glossary rows count towards the prompt. Token counts
+    are computed with one encoder, and the prompt is counted once with
+    per-row glossary costs added on top. The translation memory is only
+    read, never written or evicted.
+    """
+
+    def __init__(
+            self,
+            translator: Translator,
+            base_latency: float = 0.6,
+            output_tokens_per_second: float = 80,
+    ):
+        self.translator = translator
+        self.base_latency = base_latency
+        self.output_tokens_per_second = output_tokens_per_second
+
+        encode = translator.encoding.encode
+        self._encode = encode
+        protected = translator.protect
+        self._prompt_tokens = translator.count_tokens(translator.messages("", protected=protected))
+        self._packed_prompt_tokens = translator.count_tokens(
+            translator.messages("", packed=True, protected=protected)
+        )
+        self._row_tokens = {
+            term: len(encode(f"{term} - {translation}\n"))
+            for term, translation in translator.glossary.terms.items()
+        }
+
+    def _glossary_tokens(self, terms: Iterable[str]) -> int:
+        return sum(self._row_tokens[term] for term in terms)
+
+    def estimate_texts(self, texts: Iterable[str], seen: set | None = None) -> Estimate:
+        """Estimate a stream of msgids; `seen` carries deduplication across calls."""
+        translator = self.translator
+        seen = set() if seen is None else seen
+        estimate = Estimate()
+
+        pack_terms: set = set()
+        pack_tokens = 0
+        pack_count = 0
+
+        def add_request(prompt_tokens: int, completion_tokens: int):
+            estimate.requests += 1
+            estimate.prompt_tokens += prompt_tokens
+            estimate.completion_tokens += completion_tokens
+
+        def flush_pack():
+            nonlocal pack_terms, pack_tokens, pack_count
+            if pack_count:
+                add_request(
+                    self._packed_prompt_tokens + self._glossary_tokens(pack_terms) + pack_tokens,
+                    int(pack_tokens * OUTPUT_TOKEN_RATIO),
+                )
+            pack_terms, pack_tokens, pack_count = set(), 0, 0
+
+        for text in texts:
+            estimate.entries += 1
+            normalized = text.strip()
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            estimate.unique_texts += 1
+
+            sent_text = normalized
+            if translator.protect:
+                masked = mask(normalized)
+                if masked.is_untranslatable:
+                    estimate.skipped += 1
+                    continue
+                sent_text = masked.text
+
+            if translator.memory is not None and translator.memory.contains(
+                TranslationMemory.make_key(normalized, translator.memory_context)
+            ):
+                estimate.cache_hits += 1
+                continue
+
+            n_tokens = len(self._encode(sent_text))
+            terms = translator.glossary.relevant_terms(sent_text)
+            if translator.pack_tokens and n_tokens <= translator.max_packed_text_tokens:
+                if pack_tokens + n_tokens > translator.pack_tokens:
+                    flush_pack()
+                pack_terms.update(terms)
+                pack_tokens += n_tokens + PACKED_TEXT_OVERHEAD
+                pack_count += 1
+            else:
+                add_request(
+                    self._prompt_tokens + self._glossary_tokens(terms) + n_tokens,
+                    min(translator.max_generated_tokens, int(n_tokens * OUTPUT_TOKEN_RATIO)),
+                )
+        flush_pack()
+        return self._finish(estimate)
+
+    def _finish(self, estimate: Estimate) -> Estimate:
+        translator = self.translator
+        input_price, output_price = MODEL_PRICES.get(translator.model, MODEL_PRICES["gpt-4o-mini"])
+        estimate.cost = (
+            estimate.prompt_tokens * input_price + estimate.completion_tokens * output_price
+        ) / 1_000_000
+
+        # The slowest of concurrency, request budget and token budget sets the pace.
+        latency = (
+            estimate.requests * self.base_latency
+            + estimate.completion_tokens / self.output_tokens_per_second
+        )
+        limiter = translator.rate_limiter
+        estimate.seconds = max(
+            latency / translator.concurrency,
+            estimate.requests / limiter.requests_per_minute * 60,
+            (estimate.prompt_tokens + estimate.completion_tokens) / limiter.tokens_per_minute * 60,
+        )
+        return estimate
+
+    def estimate(self, path: str, incremental: bool = False) -> Estimate:
+        """Estimate one .po file, or every .po file under a directory or glob.
+
+        Files are assumed to run as one job on a shared worker pool, so
+        texts repeated across files are counted once. They are read with the
+        streaming reader, so large catalogs are never loaded whole.
+        """
+        if os.path.isdir(path):
+            paths = sorted(glob.glob(os.path.join(path, "**", "*.po"), recursive=True))
+        else:
+            paths = sorted(glob.glob(path)) or [path]
+
+        seen = set()
+        total = Estimate()
+        for po_path in paths:
+            texts = (
+                record.msgid
+                for record in iter_entries(po_path)
+                if record.msgid and (record.needs_translation or not incremental)
+            )
+            file_estimate = self.estimate_texts(texts, seen)
+            logger.info(f"Estimate for {po_path}: {file_estimate.as_dict()}")
+            for field in (
+                "entries", "unique_texts", "skipped", "cache_hits", "requests", "prompt_tokens", "completion_tokens"
+            ):
+                setattr(total, field, getattr(total, field) + getattr(file_estimate, field))
+        return self._finish(total)
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Estimate the cost of translating .po files.")
+    parser.add_argument("path", help=".po file, directory or glob")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=int, default=500)
+    parser.add_argument("--tokens-per-minute", type=int, default=200_000)
+    parser.add_argument("--pack-tokens", type=int, default=0)
+    parser.add_argument("--memory", default=TranslationMemory.DEFAULT_PATH)
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open_memory(args.memory if os.path.exists(args.memory) else None, readonly=True) as memory:
+        translator = Translator(
+            None,
+            model=args.model,
+            concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            memory=memory,
+            pack_tokens=args.pack_tokens,
+        )
+        print(json.dumps(Estimator(translator).estimate(args.path, args.incremental).as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from functools import cached_property
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from loguru import logger
+
+DEFAULT_GLOSSARY_URL = "https://docs.google.com/spreadsheets/d/1Uu2dv8W4mKegu_EswaXOhtIkOURv5Ixn/export?gid=827914249&format=csv"
+CACHE_DIR = os.environ.get(
+    "PO_TRANSLATOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "po_translator")
+)
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def stem(word: str) -> str:
+    """Crude English stemmer, enough to match "functions" or "graphing" to a glossary term."""
+    if word.endswith("'s"):
+        word = word[:-2]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    return word
+
+
+def stems(text: str) -> List[str]:
+    return [stem(word) for word in WORD_PATTERN.findall(text.lower())]
+
+
+class Glossary:
+    """English to Ukrainian terms with an index for picking the ones a text uses.
+
+    Terms are indexed by the stem of their first word, so finding the relevant
+    rows costs one dict lookup per word of the text instead of a scan of the
+    whole glossary.
+    """
+
+    def __init__(self, terms: Dict[str, str]):
+        self.terms = terms
+        self._order = {term: position for position, term in enumerate(terms)}
+        self._index: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        for term in terms:
+            term_stems = tuple(stems(term))
+            if term_stems:
+                self._index.setdefault(term_stems[0], []).append((term_stems, term))
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Glossary":
+        logger.info(f"Loading glossary from {path}")
+        sep = "\t" if path.endswith(".tsv") else ","
+        table = pd.read_csv(path, sep=sep, index_col=0, usecols=[0, 1]).dropna()
+        glossary = cls(dict(zip(table.index.astype(str), table.iloc[:, 0].astype(str))))
+        logger.info(f"Glossary loaded successfully with {len(glossary)} terms")
+        return glossary
+
+    def relevant_terms(self, text: str) -> List[str]:
+        """Terms that occur in `text`, in glossary order."""
+        text_stems = stems(text)
+        found = set()
+        for position, word in enumerate(text_stems):
+            for term_stems, term in self._index.get(word, ()):
+                if tuple(text_stems[position:position + len(term_stems)]) == term_stems:
+                    found.add(term)
+        return sorted(found, key=self._order.__getitem__)
+
+    @cached_property
+    def rendered(self) -> str:
+        return "\n".join(f"{term} - {translation}" for term, translation in self.terms.items())
+
+    def render(self, text: str | None = None) -> str:
+        """Glossary rows for the prompt: all of them, or only those relevant to `text`."""
+        if text is None:
+            return self.rendered
+        return "\n".join(f"{term} - {self.terms[term]}" for term in self.relevant_terms(text))
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+def _download(url: str, ttl: float, offline: bool) -> str:
+    """Return a local copy of `url`, refreshing it when older than `ttl` seconds.
+
+    The copy is revalidated with its ETag, and kept as is when the network
+    is unreachable, so a node that downloaded the glossary once keeps working
+    offline.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    name = hashlib.sha1(url.encode()).hexdigest()
+    path = os.path.join(CACHE_DIR, f"glossary-{name}.csv")
+    meta_path = path + ".json"
+
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    is_cached = os.path.exists(path)
+    if is_cached and (offline or time.time() - meta.get("fetched", 0) < ttl):
+        return path
+    if offline:
+        raise FileNotFoundError(f"No cached copy of {url} in {CACHE_DIR} and offline mode is on")
+
+    request = urllib.request.Request(url)
+    if is_cached and meta.get("etag"):
+        request.add_header("If-None-Match", meta["etag"])
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            content = response.read()
+            etag = response.headers.get("ETag")
+        with open(path + ".tmp", "wb") as glossary_file:
+            glossary_file.write(content)
+        os.replace(path + ".tmp", path)
+        meta = {"etag": etag}
+        logger.info(f"Downloaded glossary from {url}")
+    except urllib.error.HTTPError as e:
+        if not is_cached:
+            raise
+        if e.code != 304:
+            logger.warning(f"Could not refresh glossary (HTTP {e.code}), using cached copy")
+            return path
+        logger.info("Cached glossary is up to date")
+    except OSError as e:
+        # Unreachable network, DNS failures and timeouts.
+        if not is_cached:
+            raise
+        logger.warning(f"Could not refresh glossary ({getattr(e, 'reason', e)}), using cached copy")
+        return path
+
+    meta["fetched"] = time.time()
+    with open(meta_path, "w") as meta_file:
+        json.dump(meta, meta_file)
+    return path
+
+
+_glossaries: Dict[str, Tuple[Glossary, float, float]] = {}
+_glossaries_lock = threading.Lock()
+_refreshing: set = set()
+
+
+def _load(source: str, ttl: float, offline: bool) -> Glossary:
+    # Runs without the lock held, so a slow download doesn't hold up other sources.
+    is_url = source.startswith(("http://", "https://"))
+    path = _download(source, ttl, offline) if is_url else source
+    modified = os.path.getmtime(path)
+    with _glossaries_lock:
+        cached = _glossaries.get(source)
+    if cached is not None and cached[2] == modified:
+        glossary = cached[0]
+    else:
+        glossary = Glossary.from_csv(path)
+    with _glossaries_lock:
+        _glossaries[source] = (glossary, time.time(), modified)
+    return glossary
+
+
+def _refresh(source: str, ttl: float, offline: bool):
+    try:
+        _load(source, ttl, offline)
+    except Exception as e:
+        logger.warning(f"Could not refresh glossary from {source}: {e}")
+    finally:
+        with _glossaries_lock:
+            _refreshing.discard(source)
+
+
+def load_glossary(
+        source: str | None = None,
+        ttl: float = 24 * 60 * 60,
+        offline: bool | None = None,
+) -> Glossary:
+    """Process-wide glossary, parsed once per source and refreshed after `ttl` seconds.
+
+    `source` is a local .csv/.tsv path or a URL; it defaults to the
+    PO_TRANSLATOR_GLOSSARY environment variable, then to the team spreadsheet.
+    URLs are served from an on-disk copy, see `_download`. Offline mode
+    (PO_TRANSLATOR_OFFLINE=1) never touches the network.
+
+    Only the first load of a source blocks. Once a glossary is loaded, an
+    expired one keeps being returned while a background thread refreshes
+    it, so translators built on an event loop never wait on the network.
+    """
+    source = source or os.environ.get("PO_TRANSLATOR_GLOSSARY", DEFAULT_GLOSSARY_URL)
+    if offline is None:
+        offline = os.environ.get("PO_TRANSLATOR_OFFLINE", "") not in ("", "0")
+
+    with _glossaries_lock:
+        cached = _glossaries.get(source)
+        if cached is not None:
+            if time.time() - cached[1] >= ttl and source not in _refreshing:
+                _refreshing.add(source)
+                threading.Thread(target=_refresh, args=(source, ttl, offline), daemon=True).start()
+            return cached[0]
+    return _load(source, ttl, offline)
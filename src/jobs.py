@@ -0,0 +1,163 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict
+
+from loguru import logger
+
+from pool import POOL
+from read_pot import translate_pofile_with, translator_stats
+from translation_memory import TranslationMemory, open_memory
+from translator import Translator
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    """One .po file translation submitted from the UI."""
+
+    id: str
+    input_path: str
+    output_path: str
+    incremental: bool = False
+    status: str = QUEUED
+    done: int = 0
+    total: int = 0
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    error: str | None = None
+    stats: Dict[str, int] = field(default_factory=dict)
+    translator: Translator | None = field(default=None, repr=False)
+    future: concurrent.futures.Future | None = field(default=None, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def tokens(self) -> int:
+        if self.translator is None:
+            return 0
+        return self.translator.token_usage_prompt + self.translator.token_usage_generated
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left at the rate entries have been finishing so far."""
+        if self.started is None or not self.done or self.done >= self.total:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.done * (self.total - self.done)
+
+    def update(self, done: int, total: int):
+        self.done = done
+        self.total = total
+
+    def describe(self) -> str:
+        text = f"Job {self.id}: {self.status}"
+        if self.total:
+            text += f", {self.done}/{self.total} entries"
+        text += f", {self.tokens} tokens"
+        if self.status == RUNNING and self.eta is not None:
+            text += f", about {self.eta:.0f}s left"
+        if self.error:
+            text += f"\n{self.error}"
+        return text
+
+
+class JobQueue:
+    """Translation jobs run on one background event loop shared by every UI session.
+
+    At most `max_jobs` files are translated at once; further jobs wait in
+    order. Handlers only submit jobs and poll them, so they return right away
+    however long a file takes.
+    """
+
+    def __init__(
+            self,
+            max_jobs: int = 2,
+            concurrency: int = 8,
+            memory_path: str | None = TranslationMemory.DEFAULT_PATH,
+            keep_finished: int = 100,
+    ):
+        self.concurrency = concurrency
+        self.memory_path = memory_path
+        self.keep_finished = keep_finished
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._workers = asyncio.Semaphore(max_jobs)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="translation-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, api_key: str, input_path: str, output_path: str, incremental: bool = False) -> Job:
+        job = Job(uuid.uuid4().hex[:12], input_path, output_path, incremental)
+        with self._lock:
+            self._forget_finished()
+            self.jobs[job.id] = job
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, api_key), self.loop)
+        job.future.add_done_callback(lambda future: self._settle(job, future))
+        logger.info(f"Queued job {job.id} for {input_path}")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self.jobs.get(job_id.strip())
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        job.future.cancel()
+        return True
+
+    @staticmethod
+    def _settle(job: Job, future: concurrent.futures.Future):
+        # A job cancelled while still queued never gets to record it itself.
+        if future.cancelled() and not job.is_finished:
+            job.status = CANCELLED
+            job.finished = time.time()
+
+    def _forget_finished(self):
+        finished = [job for job in self.jobs.values() if job.is_finished]
+        for job in sorted(finished, key=lambda job: job.finished)[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: Job, api_key: str):
+        try:
+            async with self._workers:
+                job.status = RUNNING
+                job.started = time.time()
+                # SQLite connections stay on the thread that opened them.
+                with open_memory(self.memory_path) as memory, POOL.lease(api_key) as client, Translator(
+                    client, concurrency=self.concurrency, memory=memory
+                ) as translator:
+                    job.translator = translator
+                    await translate_pofile_with(
+                        translator,
+                        job.input_path,
+                        job.output_path,
+                        incremental=job.incremental,
+                        on_progress=job.update,
+                    )
+            job.stats = translator_stats(translator)
+            job.status = DONE
+        except asyncio.CancelledError:
+            # The journal is kept, so submitting the file again resumes it.
+            job.status = CANCELLED
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            logger.info(job.describe())
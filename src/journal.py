@@ -0,0 +1,76 @@
+import json
+import os
+from typing import Dict, Iterable, Tuple
+
+import polib
+from loguru import logger
+from typing_extensions import Self
+
+from po_stream import EntryRecord
+from translator import Translation
+
+
+class Journal:
+    """Append-only JSONL log of translated entries, used to resume an interrupted file.
+
+    Every finished batch is appended and flushed right away, so after a crash
+    or restart only the requests that were in flight have to be paid for again.
+    Leaving a `with` block closes the file but keeps it, so a failed run can be
+    resumed; `remove` drops it once the output has been written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[Tuple[str, str], Translation] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line may be cut short by the crash.
+                        continue
+                    self.done[(record["msgctxt"], record["msgid"])] = Translation(
+                        record["msgstr"], not record.get("fuzzy", False)
+                    )
+            logger.info(f"Resuming from {path} with {len(self.done)} translated entries")
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def key(entry: polib.POEntry | EntryRecord) -> Tuple[str, str]:
+        return entry.msgctxt or "", entry.msgid
+
+    def get(self, entry: polib.POEntry | EntryRecord) -> Translation | None:
+        return self.done.get(self.key(entry))
+
+    def record(self, entries: Iterable[polib.POEntry]):
+        self.record_translations((entry, Translation(entry.msgstr, not entry.fuzzy)) for entry in entries)
+
+    def record_translations(self, translations: Iterable[Tuple[polib.POEntry | EntryRecord, Translation]]):
+        # Only what was loaded on resume is kept in `done`, so recording stays flat in memory.
+        for entry, translation in translations:
+            if not translation.text:
+                continue
+            msgctxt, msgid = self.key(entry)
+            self._file.write(
+                json.dumps(
+                    {"msgctxt": msgctxt, "msgid": msgid, "msgstr": translation.text, "fuzzy": not translation.ok},
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        """Drop the journal once the output file has been written."""
+        self.close()
+        os.remove(self.path)
@@ -0,0 +1,159 @@
+import json
+import statistics
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
+
+
+@dataclass
+class RequestRecord:
+    """One chat completion as seen by the translator."""
+
+    queue_wait: float
+    latency: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    texts: int = 1
+    error: str | None = None
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative(self) -> Dict[str, int]:
+        result, total = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result[str(bound)] = total
+        return result
+
+
+class Metrics:
+    """Per-request records of a translator, aggregated into histograms and counters.
+
+    Recording is in-memory only, so it is cheap enough for the request hot
+    path; export with `to_prometheus` or `to_json` when needed.
+    """
+
+    def __init__(self, keep_records: int = 1000):
+        self.histograms = {
+            "queue_wait_seconds": Histogram(LATENCY_BUCKETS),
+            "request_latency_seconds": Histogram(LATENCY_BUCKETS),
+            "prompt_tokens": Histogram(TOKEN_BUCKETS),
+            "completion_tokens": Histogram(TOKEN_BUCKETS),
+        }
+        self.requests = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.errors: Counter = Counter()
+        self.records: Deque[RequestRecord] = deque(maxlen=keep_records)
+
+    def record_request(self, record: RequestRecord):
+        self.records.append(record)
+        self.requests += 1
+        self.retries += record.retries
+        self.histograms["queue_wait_seconds"].observe(record.queue_wait)
+        self.histograms["request_latency_seconds"].observe(record.latency)
+        if record.error is not None:
+            self.errors[record.error] += 1
+            return
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.histograms["prompt_tokens"].observe(record.prompt_tokens)
+        self.histograms["completion_tokens"].observe(record.completion_tokens)
+
+    def record_cache(self, hit: bool):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def to_prometheus(self, prefix: str = "po_translator") -> str:
+        lines = []
+        for name, value in (
+            ("requests_total", self.requests),
+            ("retries_total", self.retries),
+            ("prompt_tokens_total", self.prompt_tokens),
+            ("completion_tokens_total", self.completion_tokens),
+            ("cache_hits_total", self.cache_hits),
+            ("cache_misses_total", self.cache_misses),
+        ):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {value}")
+
+        lines.append(f"# TYPE {prefix}_errors_total counter")
+        for error, count in sorted(self.errors.items()):
+            lines.append(f'{prefix}_errors_total{{class="{error}"}} {count}')
+
+        for name, histogram in self.histograms.items():
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for bound, count in histogram.cumulative().items():
+                lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{prefix}_{name}_sum {histogram.sum}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        """Totals, histograms, and p50/p99 over the most recent records."""
+        recent = {}
+        for field in ("queue_wait", "latency", "prompt_tokens", "completion_tokens"):
+            values = sorted(
+                getattr(record, field)
+                for record in self.records
+                if record.error is None or not field.endswith("tokens")
+            )
+            if values:
+                recent[field] = {
+                    "p50": values[len(values) // 2],
+                    "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+                    "mean": statistics.fmean(values),
+                }
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "errors": dict(self.errors),
+            "recent": recent,
+            "histograms": {
+                name: {"buckets": histogram.cumulative(), "sum": histogram.sum, "count": histogram.count}
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    def dump(self, path: str):
+        """Write Prometheus text, or JSON when `path` ends with .json."""
+        with open(path, "w") as metrics_file:
+            if path.endswith(".json"):
+                json.dump(self.to_json(), metrics_file, indent=2)
+            else:
+                metrics_file.write(self.to_prometheus())
+
+
+# Shared by translators that are not given their own metrics, so one process
+# reports one set of numbers.
+METRICS = Metrics()
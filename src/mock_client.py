@@ -0,0 +1,216 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import httpx
+from openai import APITimeoutError, NotFoundError, RateLimitError
+from openai.types import Batch, BatchRequestCounts, CompletionUsage, FileObject
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+MOCK_URL = "https://mock.openai.local/v1/chat/completions"
+
+
+def approximate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class MockAsyncOpenAI:
+    """Offline stand-in for `AsyncOpenAI` chat completions.
+
+    Answers echo the user message, which keeps the output well-formed for
+    both single and packed (JSON array) requests. Latency is drawn from a
+    configurable distribution plus a per-token generation time, 429s and
+    timeouts can be injected with fixed probabilities, and token usage is
+    accounted with a four-characters-per-token approximation.
+
+    The files and batches endpoints are imitated too: a batch completes
+    `batch_latency` seconds after it is created and its output file holds
+    one echoed answer per request line.
+    """
+
+    def __init__(
+            self,
+            latency: str = "lognormal",
+            mean_latency: float = 0.5,
+            latency_sigma: float = 0.5,
+            output_tokens_per_second: float = 0,
+            rate_limit_probability: float = 0.0,
+            timeout_probability: float = 0.0,
+            retry_after: float | None = 1.0,
+            seed: int | None = None,
+            batch_latency: float = 0.0,
+            max_latency_samples: int = 10_000,
+    ):
+        self.latency = latency
+        self.mean_latency = mean_latency
+        self.latency_sigma = latency_sigma
+        self.output_tokens_per_second = output_tokens_per_second
+        self.rate_limit_probability = rate_limit_probability
+        self.timeout_probability = timeout_probability
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.batch_latency = batch_latency
+        self.max_latency_samples = max_latency_samples
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Batch] = {}
+        self._batch_started: Dict[str, float] = {}
+        self.n_requests = 0
+        self.n_rate_limited = 0
+        self.n_timeouts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # A uniform sample (reservoir) of request latencies, so long runs
+        # don't grow the mock's own memory. Drawn with a separate generator to
+        # keep the seeded sequence of latencies and errors unchanged.
+        self.latencies: List[float] = []
+        self._n_latencies = 0
+        self._sampling = random.Random(seed)
+
+    def _sample_latency(self) -> float:
+        if self.latency == "constant":
+            return self.mean_latency
+        if self.latency == "uniform":
+            return self.random.uniform(0, 2 * self.mean_latency)
+        if self.latency == "exponential":
+            return self.random.expovariate(1 / self.mean_latency)
+        if self.latency == "lognormal":
+            # Parametrised so the distribution's mean is `mean_latency`.
+            mu = -self.latency_sigma ** 2 / 2
+            return self.mean_latency * self.random.lognormvariate(mu, self.latency_sigma)
+        raise ValueError(f"Unknown latency distribution: {self.latency}")
+
+    async def _create(self, model: str, messages: List[dict], max_tokens: int | None = None, **kwargs) -> ChatCompletion:
+        self.n_requests += 1
+        started = time.perf_counter()
+        request = httpx.Request("POST", MOCK_URL)
+
+        if self.random.random() < self.rate_limit_probability:
+            self.n_rate_limited += 1
+            headers = {} if self.retry_after is None else {"retry-after": str(self.retry_after)}
+            response = httpx.Response(429, headers=headers, request=request)
+            raise RateLimitError("Rate limit reached (mock)", response=response, body=None)
+
+        latency = self._sample_latency()
+        if self.random.random() < self.timeout_probability:
+            self.n_timeouts += 1
+            await asyncio.sleep(latency)
+            raise APITimeoutError(request=request)
+
+        completion = self._answer(model, messages, max_tokens)
+        if self.output_tokens_per_second:
+            latency += completion.usage.completion_tokens / self.output_tokens_per_second
+        await asyncio.sleep(latency)
+        self._record_latency(time.perf_counter() - started)
+        return completion
+
+    def _record_latency(self, latency: float):
+        self._n_latencies += 1
+        if len(self.latencies) < self.max_latency_samples:
+            self.latencies.append(latency)
+            return
+        position = self._sampling.randrange(self._n_latencies)
+        if position < self.max_latency_samples:
+            self.latencies[position] = latency
+
+    def _answer(self, model: str, messages: List[dict], max_tokens: int | None = None, **kwargs) -> ChatCompletion:
+        content = messages[-1]["content"]
+        prompt_tokens = sum(approximate_tokens(message["content"]) + 4 for message in messages) + 3
+        completion_tokens = approximate_tokens(content)
+        if max_tokens is not None:
+            completion_tokens = min(completion_tokens, max_tokens)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return ChatCompletion(
+            id=f"chatcmpl-mock-{self.n_requests}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[
+                Choice(
+                    index=0,
+                    finish_reason="stop",
+                    message=ChatCompletionMessage(role="assistant", content=content),
+                )
+            ],
+            usage=CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+    def _not_found(self, what: str) -> NotFoundError:
+        response = httpx.Response(404, request=httpx.Request("GET", MOCK_URL))
+        return NotFoundError(f"No such {what} (mock)", response=response, body=None)
+
+    async def _create_file(self, file, purpose: str, **kwargs) -> FileObject:
+        data = file.read() if hasattr(file, "read") else file
+        file_id = f"file-mock-{len(self._files) + 1}"
+        self._files[file_id] = data
+        return FileObject(
+            id=file_id,
+            bytes=len(data),
+            created_at=int(time.time()),
+            filename=getattr(file, "name", file_id),
+            object="file",
+            purpose=purpose,
+            status="processed",
+        )
+
+    async def _file_content(self, file_id: str, **kwargs) -> httpx.Response:
+        if file_id not in self._files:
+            raise self._not_found("file")
+        return httpx.Response(200, content=self._files[file_id])
+
+    async def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str, **kwargs) -> Batch:
+        if input_file_id not in self._files:
+            raise self._not_found("file")
+        batch_id = f"batch-mock-{len(self._batches) + 1}"
+        total = len(self._files[input_file_id].splitlines())
+        self._batches[batch_id] = Batch(
+            id=batch_id,
+            completion_window=completion_window,
+            created_at=int(time.time()),
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            object="batch",
+            status="in_progress",
+            request_counts=BatchRequestCounts(completed=0, failed=0, total=total),
+        )
+        self._batch_started[batch_id] = time.monotonic()
+        return self._batches[batch_id]
+
+    async def _retrieve_batch(self, batch_id: str, **kwargs) -> Batch:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            raise self._not_found("batch")
+        if batch.status == "in_progress" and time.monotonic() - self._batch_started[batch_id] >= self.batch_latency:
+            self._complete_batch(batch)
+        return batch
+
+    def _complete_batch(self, batch: Batch):
+        lines = []
+        for line in self._files[batch.input_file_id].decode("utf-8").splitlines():
+            request = json.loads(line)
+            self.n_requests += 1
+            completion = self._answer(**request["body"])
+            lines.append(json.dumps({
+                "id": f"batch-req-mock-{self.n_requests}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": "", "body": completion.model_dump()},
+                "error": None,
+            }))
+        output_file_id = f"file-mock-{len(self._files) + 1}"
+        self._files[output_file_id] = "\n".join(lines).encode("utf-8")
+        batch.status = "completed"
+        batch.completed_at = int(time.time())
+        batch.output_file_id = output_file_id
+        batch.request_counts = BatchRequestCounts(completed=len(lines), failed=0, total=len(lines))
@@ -0,0 +1,212 @@
+import os
+import re
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+import polib
+
+from translator import Translation
+
+KEYWORD_PATTERN = re.compile(r'^(msgctxt|msgid_plural|msgid|msgstr(?:\[\d+\])?)\s+"(.*)"\s*$')
+STRING_PATTERN = re.compile(r'^"(.*)"\s*$')
+
+
+class EntryRecord:
+    """What the streaming path keeps of an entry: its key, flags and where it sits in the source file."""
+
+    __slots__ = ("msgid", "msgctxt", "flags", "start", "end", "translated", "plural")
+
+    def __init__(
+            self,
+            msgid: str,
+            msgctxt: str | None,
+            flags: Tuple[str, ...],
+            start: int,
+            end: int,
+            translated: bool,
+            plural: bool,
+    ):
+        self.msgid = msgid
+        self.msgctxt = msgctxt
+        self.flags = flags
+        self.start = start
+        self.end = end
+        self.translated = translated
+        self.plural = plural
+
+    @property
+    def fuzzy(self) -> bool:
+        return "fuzzy" in self.flags
+
+    @property
+    def needs_translation(self) -> bool:
+        """Same entries as polib's untranslated_entries() + fuzzy_entries()."""
+        return not self.translated or self.fuzzy
+
+
+def _parse_block(lines: List[str], start: int, end: int) -> EntryRecord | None:
+    fields: Dict[str, List[str]] = {}
+    flags: Tuple[str, ...] = ()
+    current = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#,"):
+            flags += tuple(flag.strip() for flag in line[2:].split(",") if flag.strip())
+            continue
+        if line.startswith("#"):
+            current = None
+            continue
+        keyword = KEYWORD_PATTERN.match(line)
+        if keyword is not None:
+            current = fields.setdefault(keyword.group(1), [])
+            current.append(keyword.group(2))
+            continue
+        string = STRING_PATTERN.match(line)
+        if string is not None and current is not None:
+            current.append(string.group(1))
+
+    # Obsolete (#~) entries and stray comments have no msgid of their own.
+    if "msgid" not in fields:
+        return None
+    msgstrs = [value for keyword, value in fields.items() if keyword.startswith("msgstr")]
+    return EntryRecord(
+        msgid=polib.unescape("".join(fields["msgid"])),
+        msgctxt=polib.unescape("".join(fields["msgctxt"])) if "msgctxt" in fields else None,
+        flags=flags,
+        start=start,
+        end=end,
+        translated=any("".join(value) for value in msgstrs),
+        plural="msgid_plural" in fields,
+    )
+
+
+def iter_entries(path: str) -> Iterator[EntryRecord]:
+    """Yield the entries of a UTF-8 .po file one at a time, header included, without loading the file."""
+    lines: List[str] = []
+    start = end = 0
+    seen_msgstr = False
+    with open(path, "rb") as pofile:
+        position = 0
+        for raw_line in pofile:
+            line = raw_line.decode("utf-8")
+            stripped = line.strip()
+            # A blank line, or a comment or keyword right after a msgstr, starts the next entry.
+            starts_next = not stripped or (
+                seen_msgstr and (stripped.startswith("#") or stripped.startswith(("msgctxt", "msgid ")))
+            )
+            if starts_next and lines:
+                record = _parse_block(lines, start, end)
+                if record is not None:
+                    yield record
+                lines = []
+                seen_msgstr = False
+            if stripped:
+                if not lines:
+                    start = position
+                lines.append(line)
+                end = position + len(raw_line)
+                seen_msgstr = seen_msgstr or stripped.startswith("msgstr")
+            position += len(raw_line)
+    if lines:
+        record = _parse_block(lines, start, end)
+        if record is not None:
+            yield record
+
+
+def format_msgstr(text: str, newline: str) -> str:
+    """msgstr lines in polib's layout: multi-line texts start with an empty string."""
+    if "\n" not in text.rstrip("\n"):
+        return f'msgstr "{polib.escape(text)}"{newline}'
+    lines = [f'msgstr ""{newline}']
+    lines += [f'"{polib.escape(part)}"{newline}' for part in text.splitlines(keepends=True)]
+    return "".join(lines)
+
+
+def patch_entry(block: str, translation: Translation) -> str:
+    """Rewrite one entry's source text with a new msgstr and fuzzy state, like translator.apply_translation."""
+    newline = "\r\n" if "\r\n" in block else "\n"
+    lines = block.splitlines(keepends=True)
+    flags: List[str] = []
+    for line in lines:
+        if line.startswith("#,"):
+            flags += [flag.strip() for flag in line[2:].split(",") if flag.strip()]
+    if translation.ok:
+        flags = [flag for flag in flags if flag != "fuzzy"]
+    elif "fuzzy" not in flags:
+        flags.append("fuzzy")
+    flags_line = f"#, {', '.join(flags)}{newline}" if flags else ""
+
+    patched = []
+    for line in lines:
+        if line.startswith("#,"):
+            continue
+        # A clean translation drops the previous msgid a fuzzy entry carried.
+        if line.startswith("#|") and translation.ok:
+            continue
+        if line.startswith(("#|", "msgctxt", "msgid")) and flags_line:
+            patched.append(flags_line)
+            flags_line = ""
+        if line.startswith("msgstr"):
+            break
+        patched.append(line)
+    return "".join(patched) + format_msgstr(translation.text, newline)
+
+
+class StreamWriter:
+    """Copies a .po file to `output_path`, patching in translations as they arrive.
+
+    Results may come in any order; each is held only until every entry before
+    it has been written, then the source is copied up to it and the patched
+    entry appended. Entries resolved with None are copied unchanged. Output
+    goes to a .part file that replaces `output_path` on `close`, or is
+    deleted on `abort`.
+    """
+
+    def __init__(self, source_path: str, output_path: str):
+        self.output_path = output_path
+        self._source: BinaryIO = open(source_path, "rb")
+        self._output: BinaryIO = open(output_path + ".part", "wb")
+        self._position = 0
+        self._next = 0
+        self._pending: Dict[int, Tuple[EntryRecord, Translation | None]] = {}
+        self.written = 0
+
+    def _copy_to(self, offset: int):
+        self._source.seek(self._position)
+        remaining = offset - self._position
+        while remaining > 0:
+            chunk = self._source.read(min(remaining, 1 << 16))
+            if not chunk:
+                break
+            self._output.write(chunk)
+            remaining -= len(chunk)
+        self._position = offset
+
+    def set(self, index: int, record: EntryRecord, translation: Translation | None) -> int:
+        """Resolve entry number `index`; returns how many entries got written as a result."""
+        self._pending[index] = (record, translation)
+        written = 0
+        while self._next in self._pending:
+            record, translation = self._pending.pop(self._next)
+            if translation is not None and translation.text:
+                self._copy_to(record.start)
+                self._source.seek(record.start)
+                block = self._source.read(record.end - record.start).decode("utf-8")
+                self._output.write(patch_entry(block, translation).encode("utf-8"))
+                self._position = record.end
+            self._next += 1
+            written += 1
+        self.written += written
+        return written
+
+    def close(self):
+        self._copy_to(os.fstat(self._source.fileno()).st_size)
+        self._source.close()
+        self._output.close()
+        os.replace(self.output_path + ".part", self.output_path)
+
+    def abort(self):
+        """Close the files without touching `output_path`."""
+        self._source.close()
+        self._output.close()
+        if os.path.exists(self.output_path + ".part"):
+            os.remove(self.output_path + ".part")
@@ -0,0 +1,135 @@
+import asyncio
+import importlib.util
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+import httpx
+from loguru import logger
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from translator import Translator
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class TranslatorPool:
+    """Long-lived `AsyncOpenAI` clients and `Translator`s, reused across requests.
+
+    Clients keep their HTTP connections alive between requests, so only the
+    first request for an API key pays for TLS and connection setup. Entries
+    are keyed by the running event loop as well, because connections and
+    asyncio primitives can't be shared between loops, and are closed after
+    `idle_timeout` seconds without use. Clients held through `lease` are
+    never closed, however long the work that holds them runs.
+    """
+
+    def __init__(
+            self,
+            idle_timeout: float = 600,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+    ):
+        self.idle_timeout = idle_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=idle_timeout,
+        )
+        self._clients: Dict[Tuple[str, asyncio.AbstractEventLoop], Tuple[AsyncOpenAI, float]] = {}
+        self._translators: Dict[tuple, Tuple[Translator, float]] = {}
+        self._leases: Dict[Tuple[str, asyncio.AbstractEventLoop], int] = {}
+        self._lock = threading.Lock()
+
+    def client(self, api_key: str) -> AsyncOpenAI:
+        """Client for `api_key` on the running event loop."""
+        key = (api_key, asyncio.get_running_loop())
+        with self._lock:
+            self._evict_idle()
+            client, _ = self._clients.get(key, (None, None))
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=DefaultAsyncHttpxClient(limits=self.limits, http2=HTTP2_AVAILABLE),
+                )
+                logger.debug(f"Opened a pooled OpenAI client (HTTP/2: {HTTP2_AVAILABLE})")
+            self._clients[key] = (client, time.monotonic())
+        return client
+
+    @contextmanager
+    def lease(self, api_key: str) -> Iterator[AsyncOpenAI]:
+        """Client for `api_key` that stays open until the `with` block ends."""
+        key = (api_key, asyncio.get_running_loop())
+        client = self.client(api_key)
+        with self._lock:
+            self._leases[key] = self._leases.get(key, 0) + 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._leases[key] -= 1
+                if not self._leases[key]:
+                    del self._leases[key]
+                # Idle time counts from the end of the last lease.
+                if key in self._clients:
+                    self._clients[key] = (client, time.monotonic())
+
+    def translator(self, api_key: str, model: str = "gpt-4o-mini", **kwargs: Any) -> Translator:
+        """Shared translator for `api_key` and `model` on the running event loop.
+
+        Requests through it share one rate limiter and concurrency cap. Use
+        `translator.track_usage` for per-request token counts, and a fresh
+        `Translator` around `lease()` for `with translator:` sessions, whose
+        state is not meant to be shared. Hold a `lease` on the API key while
+        using the returned translator.
+        """
+        loop = asyncio.get_running_loop()
+        key = (api_key, model, loop, tuple(sorted(kwargs.items())))
+        client = self.client(api_key)
+        with self._lock:
+            translator, _ = self._translators.get(key, (None, None))
+            if translator is None:
+                translator = Translator(client, model=model, **kwargs)
+            self._translators[key] = (translator, time.monotonic())
+        return translator
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, (translator, last_used) in list(self._translators.items()):
+            if now - last_used > self.idle_timeout or key[2].is_closed():
+                del self._translators[key]
+        for (api_key, loop), (client, last_used) in list(self._clients.items()):
+            if loop.is_closed() or (now - last_used > self.idle_timeout and (api_key, loop) not in self._leases):
+                del self._clients[(api_key, loop)]
+                self._close(client, loop)
+                # Translators built on this client can't be handed out anymore.
+                for key in [key for key in self._translators if (key[0], key[2]) == (api_key, loop)]:
+                    del self._translators[key]
+
+    @staticmethod
+    def _close(client: AsyncOpenAI, loop: asyncio.AbstractEventLoop):
+        if loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(client.close())
+        else:
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+
+    def close(self):
+        """Close every pooled client."""
+        with self._lock:
+            clients = list(self._clients.items())
+            self._clients.clear()
+            self._translators.clear()
+        for (_, loop), (client, _) in clients:
+            self._close(client, loop)
+
+
+# Shared by every request handler and job in the process.
+POOL = TranslatorPool()
@@ -201,4 +201,21 @@ I will re-count all the backslashes and other symbols and i swear to god if you
 # ```
 # Before answering analyze your results critically and re-generate translation with improvements. Make sure that all the text is translated and all special symbols and commands are preserved.
 # Give answer strictly in json format with "final_translation" as key and your translation as value.
-# """
\ No newline at end of file
+# """
+
+packing_prompt = """
+This time the input is a JSON array of separate texts. Apply the algorithm to every element on its own.
+Answer only with a JSON array of strings: the translation of each element, in the same order and with exactly the same number of elements.
+"""
+
+protected_translator_prompt = """
+You are an automatic special math translator. Translate the text I send into Ukrainian.
+It comes from math lessons and may contain markdown. Placeholders like ⟦0⟧ stand for formulas, images, widgets and links:
+copy every placeholder exactly once and unchanged, moving it only if Ukrainian word order requires it.
+Keep markdown markup as it is and translate only the words. If there is nothing to translate, echo the text unaltered.
+Answer only with the translation.
+Use glossary to improve your translation when possible:
+```
+{glossary}
+```
+"""
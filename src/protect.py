@@ -0,0 +1,109 @@
+import re
+from typing import List
+
+# Spans the model must copy verbatim. Order matters: display math before
+# inline math, so `$$` is not read as an empty inline formula. Like pandoc,
+# inline math opens with `$` before a non-space and closes with `$` after a
+# non-space and not before a digit, so prices stay prose.
+PROTECTED_PATTERN = re.compile(
+    r"""
+      (?<!\\)\$\$.+?(?<!\\)\$\$                    # display math
+    | (?<!\\)\$(?=\S).+?(?<=\S)(?<!\\)\$(?!\d)  # inline math
+    | \\begin\{(?P<env>[a-zA-Z]+\*?)\}.*?\\end\{(?P=env)\}  # environments outside of $
+    | \[\[\u2603[^\]]*\]\]                         # [[☃ image 1]] widgets
+    | !\[[^\]]*\]\([^)]*\)                         # markdown images
+    | (?:https?|web\+graphie)://[^\s)\]]*[^\s)\].,;:!?]  # links
+    """,
+    re.S | re.X,
+)
+# Commands whose argument is prose inside math and still needs translating.
+TEXT_COMMAND_PATTERN = re.compile(r"\\(?:text|textbf|textit|mbox)\s*\{")
+PLACEHOLDER_PATTERN = re.compile(r"\u27e6\s*(\d+)\s*\u27e7")
+LETTER_PATTERN = re.compile(r"[^\W\d_]")
+
+
+def placeholder(index: int) -> str:
+    return f"\u27e6{index}\u27e7"
+
+
+def _closing_brace(text: str, start: int) -> int:
+    """Index of the brace closing the group that starts right before `start`, or -1."""
+    depth = 1
+    position = start
+    while position < len(text):
+        char = text[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return position
+        position += 1
+    return -1
+
+
+class MaskedText:
+    """Text with formulas, widgets, images and links swapped for ⟦n⟧ placeholders.
+
+    Only the prose is left for the model, including the contents of
+    `\\text{}`-like commands inside formulas, which stay in place between the
+    placeholders of the surrounding formula.
+    """
+
+    def __init__(self, text: str):
+        self.source = text
+        self.spans: List[str] = []
+        parts = []
+        position = 0
+        for match in PROTECTED_PATTERN.finditer(text):
+            parts.append(text[position:match.start()])
+            parts.append(self._mask_span(match.group()))
+            position = match.end()
+        parts.append(text[position:])
+        self.text = "".join(parts)
+
+    def _protect(self, span: str) -> str:
+        if not span:
+            return ""
+        self.spans.append(span)
+        return placeholder(len(self.spans) - 1)
+
+    def _mask_span(self, span: str) -> str:
+        if not span.startswith(("$", "\\begin")):
+            return self._protect(span)
+
+        parts = []
+        position = 0
+        for command in TEXT_COMMAND_PATTERN.finditer(span):
+            if command.start() < position:
+                continue
+            end = _closing_brace(span, command.end())
+            if end == -1:
+                break
+            content = span[command.end():end]
+            if not LETTER_PATTERN.search(content):
+                continue
+            parts.append(self._protect(span[position:command.end()]))
+            parts.append(content)
+            position = end
+        parts.append(self._protect(span[position:]))
+        return "".join(parts)
+
+    @property
+    def is_untranslatable(self) -> bool:
+        """True when nothing but formulas, widgets, links and punctuation is left."""
+        return not LETTER_PATTERN.search(PLACEHOLDER_PATTERN.sub("", self.text))
+
+    def unmask(self, translated: str) -> str | None:
+        """Put the protected spans back, or return None if the model lost or duplicated a placeholder."""
+        found = [int(index) for index in PLACEHOLDER_PATTERN.findall(translated)]
+        if sorted(found) != list(range(len(self.spans))):
+            return None
+        return PLACEHOLDER_PATTERN.sub(lambda match: self.spans[int(match.group(1))], translated)
+
+
+def mask(text: str) -> MaskedText:
+    return MaskedText(text)
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from openai import RateLimitError
+
+
+def retry_after_seconds(error: RateLimitError) -> float | None:
+    """Read the server's retry hint from a 429 response, if it sent one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute budget.
+
+    Both budgets are token buckets that refill continuously. Callers ask for
+    capacity up front with `acquire`, so requests are paced to the account
+    limits instead of running into 429s and stalling. When a 429 still comes
+    back, `backoff` pauses every caller until the retry hint, plus up to 20%,
+    or a jittered exponential delay when there is no hint, has passed.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: int = 500,
+            tokens_per_minute: int = 200_000,
+            base_backoff: float = 1.0,
+            max_backoff: float = 60.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens = min(
+            self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    async def acquire(self, tokens: int):
+        """Wait until one request and `tokens` tokens fit in the budget, then take them."""
+        # A single oversized request must still be able to go through eventually.
+        tokens = min(tokens, self.tokens_per_minute)
+
+        # Holding the lock while sleeping keeps callers in FIFO order.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, used_tokens: int):
+        """Correct the token budget once the real usage of a request is known."""
+        self._tokens = min(
+            self.tokens_per_minute, self._tokens + estimated_tokens - used_tokens
+        )
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Pause all callers after a 429 and return the chosen delay in seconds."""
+        if retry_after is not None:
+            # Jitter in proportion to the hint (`retry-after` or `retry-after-ms`),
+            # so a short hint doesn't turn into a second-long stall of every caller.
+            delay = retry_after * random.uniform(1, 1.2)
+        else:
+            delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        # Whatever budget was left is evidently not available on the server side.
+        self._requests = min(self._requests, 0)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
@@ -1,51 +1,283 @@
 import asyncio
-from typing import Dict
+import os
+from contextlib import nullcontext
+from typing import Callable, Dict
 from loguru import logger
 
 import polib
 
-from translator import Translator, get_client
+from batch_api import translate_pofile_batch
+from estimator import Estimator
+from journal import Journal
+from po_stream import EntryRecord, StreamWriter, iter_entries
+from pool import POOL
+from translation_memory import TranslationMemory, open_memory
+from translator import Translation, Translator, apply_translation, track_usage
 
 
 async def translate_text_entry(text: str, api_key: str):
-    with Translator(get_client(api_key)) as translator:
-        translated_text = await translator.translate(text)
+    usage = track_usage()
+    with POOL.lease(api_key):
+        translated_text = await POOL.translator(api_key).translate(text)
     return translated_text, {
-        "read_tokens": translator.token_usage_prompt,
-        "gen_tokens": translator.token_usage_generated,
+        "read_tokens": usage.prompt_tokens,
+        "gen_tokens": usage.completion_tokens,
     }
 
 
-async def translate_pofile(filepath: str, output_path: str, api_key: str, batch_size: int = 5) -> dict[str, int]:
+async def translate_pofile_with(
+    translator: Translator,
+    filepath: str,
+    output_path: str,
+    batch_size: int = 5,
+    incremental: bool = False,
+    checkpoint: bool = True,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> int:
+    """Translate one .po file with a translator session that may be shared with other files.
+
+    `on_progress(done, total)` is called after every finished batch. Returns
+    the number of entries that were translated.
+    """
     source_pofile = polib.pofile(filepath)
-    translated_pofile = polib.POFile()
-    translated_pofile.metadata = source_pofile.metadata
+    if incremental:
+        entries = source_pofile.untranslated_entries() + source_pofile.fuzzy_entries()
+        translated_pofile = source_pofile
+    else:
+        entries = list(source_pofile)
+        translated_pofile = polib.POFile()
+        translated_pofile.metadata = source_pofile.metadata
+
+    # The journal is closed even if translation fails, and only removed once the output is saved.
+    with Journal(output_path + ".journal.jsonl") if checkpoint else nullcontext() as journal:
+        pending = []
+        for entry in entries:
+            journaled = journal.get(entry) if journal is not None else None
+            if journaled is None:
+                pending.append(entry)
+            else:
+                apply_translation(entry, journaled)
 
-    logger.info(f"Starting translation for PO file: {filepath}")
+        logger.info(f"Starting translation for PO file: {filepath} ({len(pending)} entries to translate)")
 
-    with Translator(get_client(api_key)) as translator:
-        for i in range(0, len(source_pofile), batch_size):
-            batch_entries = source_pofile[i:i + batch_size]
-            logger.info(f"Translating batch {i//batch_size + 1} with {len(batch_entries)} entries")
-            translated_batch = await translator.translate_entry_batch(batch_entries)
-            translated_pofile.extend(translated_batch)
+        done = len(entries) - len(pending)
+        if on_progress is not None:
+            on_progress(done, len(entries))
 
-    translated_pofile.save(output_path)
+        async def translate_entry_batch(batch: list[polib.POEntry]):
+            nonlocal done
+            translated = await translator.translate_entry_batch(batch)
+            if journal is not None:
+                journal.record(translated)
+            done += len(batch)
+            if on_progress is not None:
+                on_progress(done, len(entries))
+
+        # All batches are scheduled at once; the translator's semaphore keeps at
+        # most `concurrency` requests in flight. Entries are updated in place.
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        await asyncio.gather(*(translate_entry_batch(batch) for batch in batches))
+
+        if not incremental:
+            translated_pofile.extend(entries)
+
+        translated_pofile.save(output_path)
+        if journal is not None:
+            journal.remove()
     logger.info(f"Translation completed and saved to {output_path}")
+    return len(entries)
+
+
+async def translate_pofile_streaming(
+    translator: Translator,
+    filepath: str,
+    output_path: str,
+    batch_size: int = 5,
+    incremental: bool = False,
+    checkpoint: bool = True,
+    on_progress: Callable[[int, int], None] | None = None,
+    window: int = 1000,
+    max_unique_translations: int = 10_000,
+) -> int:
+    """Like `translate_pofile_with`, but without loading the file into polib objects.
+
+    Entries are read one at a time as compact records and their translations
+    are patched into a copy of the source as they arrive, so memory stays flat
+    however large the catalog is. At most `window` entries are read ahead of
+    the last one written. The rest of the file, header, comments and
+    formatting included, is copied unchanged; plural entries are left as
+    they are. A translator without a bound on its deduplication cache gets
+    `max_unique_translations` for the rest of its session; repeats of texts
+    evicted from it are still caught by the translation memory.
+    """
+    if translator.max_unique_translations is None:
+        translator.max_unique_translations = max_unique_translations
+
+    def selected(record: EntryRecord) -> bool:
+        return bool(record.msgid) and not record.plural and (record.needs_translation or not incremental)
+
+    total = sum(1 for record in iter_entries(filepath) if selected(record))
+    logger.info(f"Starting streaming translation for PO file: {filepath} ({total} entries)")
+    with Journal(output_path + ".journal.jsonl") if checkpoint else nullcontext() as journal:
+        writer = StreamWriter(filepath, output_path)
+        read_ahead = asyncio.Semaphore(window)
+        tasks = set()
+        done = 0
+
+        def resolve(index: int, record: EntryRecord, translation: Translation | None):
+            for _ in range(writer.set(index, record, translation)):
+                read_ahead.release()
+
+        async def translate_entry_batch(batch: list[tuple[int, EntryRecord]]):
+            nonlocal done
+            translations = [None] * len(batch)
+            try:
+                try:
+                    translations = await translator.translate_texts([record.msgid for _, record in batch])
+                except Exception as e:
+                    # Keep the source entries so the rest of the file can still be written.
+                    logger.error(f"Error during translation: {e}")
+                if journal is not None:
+                    journal.record_translations(
+                        (record, translation) for (_, record), translation in zip(batch, translations) if translation
+                    )
+            finally:
+                # Unresolved entries would hold up the writer and the read-ahead window for good.
+                for (index, record), translation in zip(batch, translations):
+                    resolve(index, record, translation)
+            done += len(batch)
+            if on_progress is not None:
+                on_progress(done, total)
+
+        def forget(task: asyncio.Task):
+            # Failed batches stay in `tasks`, so the gather below raises their error.
+            if task.cancelled() or task.exception() is None:
+                tasks.discard(task)
+
+        def schedule(batch: list[tuple[int, EntryRecord]]):
+            task = asyncio.ensure_future(translate_entry_batch(batch))
+            tasks.add(task)
+            task.add_done_callback(forget)
 
+        try:
+            batch = []
+            for index, record in enumerate(iter_entries(filepath)):
+                if read_ahead.locked() and batch:
+                    # The oldest unwritten entry may be in this batch; send it rather than wait on it.
+                    schedule(batch)
+                    batch = []
+                await read_ahead.acquire()
+                if not selected(record):
+                    resolve(index, record, None)
+                    continue
+                journaled = journal.get(record) if journal is not None else None
+                if journaled is not None:
+                    resolve(index, record, journaled)
+                    done += 1
+                    continue
+                batch.append((index, record))
+                if len(batch) == batch_size:
+                    schedule(batch)
+                    batch = []
+            if batch:
+                schedule(batch)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the batches still running before their entries are written to a closed file.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.abort()
+            raise
+
+        writer.close()
+        if journal is not None:
+            journal.remove()
+    logger.info(f"Translation completed and saved to {output_path}")
+    return total
+
+
+async def translate_pofile(
+    filepath: str,
+    output_path: str,
+    api_key: str,
+    batch_size: int = 5,
+    concurrency: int = 8,
+    memory_path: str | None = TranslationMemory.DEFAULT_PATH,
+    incremental: bool = False,
+    pack_tokens: int = 0,
+    checkpoint: bool = True,
+    batch_api: bool = False,
+    poll_interval: float = 60.0,
+    streaming: bool = False,
+) -> dict[str, int]:
+    """Translate a .po file and save the result to `output_path`.
+
+    In incremental mode only untranslated and fuzzy entries are sent to the
+    model; the source file is updated in place so every other entry, its
+    comments, occurrences and flags, and the header are kept as they are.
+
+    With `pack_tokens` set, short texts are translated several at a time in
+    requests of up to that many source tokens.
+
+    With `checkpoint` on, finished batches are journaled next to the output
+    file and a rerun after a crash resumes from the journal; the journal is
+    removed once the output is saved.
+
+    With `batch_api` on, the file goes through the OpenAI Batch API instead
+    (see batch_api.translate_pofile_batch): cheaper, but results may take
+    up to a day. The batch is polled every `poll_interval` seconds.
+
+    With `streaming` on, very large files are translated with flat memory
+    use (see translate_pofile_streaming).
+    """
+    with open_memory(memory_path) as memory, POOL.lease(api_key) as client, Translator(
+        client, concurrency=concurrency, memory=memory, pack_tokens=pack_tokens
+    ) as translator:
+        if batch_api:
+            await translate_pofile_batch(translator, filepath, output_path, incremental, poll_interval)
+        elif streaming:
+            await translate_pofile_streaming(
+                translator, filepath, output_path, batch_size, incremental, checkpoint
+            )
+        else:
+            await translate_pofile_with(
+                translator, filepath, output_path, batch_size, incremental, checkpoint
+            )
+
+    return translator_stats(translator)
+
+
+def translator_stats(translator: Translator) -> dict[str, int]:
     return {
         "read_tokens": translator.token_usage_prompt,
         "gen_tokens": translator.token_usage_generated,
+        "cache_hits": translator.n_cache_hits,
+        "deduplicated": translator.n_deduplicated,
+        "packed": translator.n_packed,
+        "skipped": translator.n_skipped,
+        "fuzzy": translator.n_invalid,
     }
 
 
+async def estimate_pofile(
+    filepath: str,
+    api_key: str | None = None,
+    concurrency: int = 8,
+    memory_path: str | None = TranslationMemory.DEFAULT_PATH,
+    incremental: bool = False,
+    pack_tokens: int = 0,
+) -> dict:
+    """Predict requests, tokens, cost and duration of `translate_pofile` offline.
 
-async def estimate_pofile(filepath: str, api_key: str):
-    source_pofile = polib.pofile(filepath)
-    token_estimate = 0
-    for entry in source_pofile:
-        token_estimate += Translator(get_client(api_key)).estimate_usage(entry)
-    return token_estimate
+    `filepath` can also be a directory or glob; no API key or network is needed.
+    """
+    if memory_path is not None and not os.path.exists(memory_path):
+        memory_path = None
+    with open_memory(memory_path, readonly=True) as memory:
+        translator = Translator(None, concurrency=concurrency, memory=memory, pack_tokens=pack_tokens)
+        estimate = Estimator(translator).estimate(filepath, incremental)
+    return estimate.as_dict()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+import hashlib
+import pathlib
+import sqlite3
+import time
+from contextlib import AbstractContextManager, nullcontext
+
+from loguru import logger
+from typing_extensions import Self
+
+
+class TranslationMemory:
+    """On-disk cache of finished translations.
+
+    Entries are keyed by a hash of the msgid together with everything else that
+    shapes the answer (model, prompt template, glossary), so changing any of
+    those naturally misses the cache. Old and least recently used rows are
+    evicted when the memory is opened. Use it in a `with` block so the
+    connection is closed even when a run fails.
+
+    With `readonly` on, the database is opened as is: nothing is evicted,
+    created or written, and lookups don't refresh last-used times, so
+    estimates don't change what a later run hits.
+    """
+
+    DEFAULT_PATH: str = "translation_memory.sqlite"
+
+    def __init__(
+            self,
+            path: str = DEFAULT_PATH,
+            max_entries: int = 200_000,
+            max_age_days: float = 180,
+            readonly: bool = False,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.readonly = readonly
+
+        if readonly:
+            self.connection = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+            logger.info(f"Translation memory opened read-only at {path} with {len(self)} entries")
+            return
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, translation TEXT NOT NULL, "
+            "created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.commit()
+        self.evict()
+        logger.info(f"Translation memory opened at {path} with {len(self)} entries")
+
+    @staticmethod
+    def make_context(*parts: str | None) -> str:
+        """Hash the translation settings once so per-entry keys stay cheap."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(msgid: str, context: str) -> str:
+        return hashlib.sha256(f"{context}\0{msgid}".encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        row = self.connection.execute(
+            "SELECT translation FROM translations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not self.readonly:
+            self.connection.execute(
+                "UPDATE translations SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.connection.commit()
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        """Check for a key without touching its last-used time."""
+        return self.connection.execute(
+            "SELECT 1 FROM translations WHERE key = ?", (key,)
+        ).fetchone() is not None
+
+    def put(self, key: str, translation: str):
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO translations (key, translation, created, used) "
+            "VALUES (?, ?, ?, ?)",
+            (key, translation, now, now),
+        )
+        self.connection.commit()
+
+    def evict(self):
+        """Drop rows older than `max_age_days`, then the least recently used overflow."""
+        cutoff = time.time() - self.max_age_days * 24 * 60 * 60
+        expired = self.connection.execute(
+            "DELETE FROM translations WHERE created < ?", (cutoff,)
+        ).rowcount
+        overflow = self.connection.execute(
+            "DELETE FROM translations WHERE key IN ("
+            "SELECT key FROM translations ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.connection.commit()
+        if expired or overflow:
+            logger.info(f"Evicted {expired} expired and {overflow} least recently used translations")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+
+def open_memory(path: str | None, readonly: bool = False) -> AbstractContextManager[TranslationMemory | None]:
+    """`with open_memory(path) as memory:` gives the memory at `path`, or None without a path."""
+    return TranslationMemory(path, readonly=readonly) if path is not None else nullcontext()
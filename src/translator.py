@@ -1,14 +1,23 @@
 import asyncio
 import json
-from typing import List
-import pandas as pd
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, NamedTuple
 import polib
 import tiktoken
 from dotenv import load_dotenv
 from loguru import logger
 from openai import AsyncOpenAI, RateLimitError
 from typing_extensions import Self
-from prompt import translator_prompt
+from glossary import load_glossary
+from metrics import METRICS, Metrics, RequestRecord
+from prompt import packing_prompt, protected_translator_prompt, translator_prompt
+from protect import mask
+from rate_limiter import RateLimiter, retry_after_seconds
+from translation_memory import TranslationMemory
+from validator import validate
 import time
 
 
@@ -17,10 +26,98 @@ def get_client(openai_key: str):
     return client
 
 
+class ApproximateEncoding:
+    """Token counter for when tiktoken's encoding files can't be downloaded (about 4 characters per token)."""
+
+    name = "approximate"
+
+    def encode(self, text: str) -> List[int]:
+        return [0] * ((len(text) + 3) // 4)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding | ApproximateEncoding:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            logger.warning(f"No tiktoken encoding known for {model}, using o200k_base")
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Offline machines without a TIKTOKEN_CACHE_DIR copy can still estimate and pace requests.
+        logger.warning(f"Could not load tiktoken encoding ({e}), approximating token counts")
+        return ApproximateEncoding()
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+# Set per request when one translator serves several requests at once, so
+# each can report its own token usage.
+_request_usage: ContextVar[Usage | None] = ContextVar("request_usage", default=None)
+
+
+def track_usage() -> Usage:
+    """Count the tokens of requests made from now on by the current task and the tasks it starts."""
+    usage = Usage()
+    _request_usage.set(usage)
+    return usage
+
+
+class Translation(NamedTuple):
+    """Result for one text: the best translation found, and whether it passed validation.
+
+    `text` is empty when no request succeeded.
+    """
+
+    text: str
+    ok: bool
+
+
+def with_whitespace_of(source: str, translation: Translation) -> Translation:
+    """`translation` of the stripped `source`, with the whitespace around `source` put back.
+
+    Copies of a text are translated once but may differ in surrounding
+    whitespace, which is kept per entry.
+    """
+    leading = source[:len(source) - len(source.lstrip())]
+    trailing = source[len(source.rstrip()):]
+    return Translation(leading + translation.text.strip() + trailing, translation.ok)
+
+
+def apply_translation(entry: polib.POEntry, translation: Translation) -> bool:
+    """Store `translation` in `entry`, flagging it fuzzy if it failed validation.
+
+    Entries without any translation are left untouched. Returns whether the
+    entry was updated.
+    """
+    if not translation.text:
+        return False
+    entry.msgstr = translation.text
+    if translation.ok:
+        if entry.fuzzy:
+            entry.flags.remove("fuzzy")
+            entry.previous_msgctxt = None
+            entry.previous_msgid = None
+            entry.previous_msgid_plural = None
+    elif not entry.fuzzy:
+        entry.flags.append("fuzzy")
+    return True
+
+
 class Translator:
     token_usage_prompt: int
     token_usage_generated: int
     n_api_requests: int
+    n_cache_hits: int
+    n_deduplicated: int
+    n_packed: int
+    n_skipped: int
+    n_validation_retries: int
+    n_invalid: int
     MAX_TOKENS_PER_REQUEST: int = 4096
     time: int
 
@@ -29,135 +126,441 @@ class Translator:
             client: AsyncOpenAI,
             model: str = "gpt-4o-mini",
             prompt: str = translator_prompt,
-            spreadsheet_path: str = "https://docs.google.com/spreadsheets/d/1Uu2dv8W4mKegu_EswaXOhtIkOURv5Ixn/export?gid=827914249&format=csv",
+            spreadsheet_path: str | None = None,
+            concurrency: int = 8,
+            requests_per_minute: int = 500,
+            tokens_per_minute: int = 200_000,
+            memory: TranslationMemory | None = None,
+            pack_tokens: int = 0,
+            pack_window: float = 0.05,
+            metrics: Metrics | None = None,
+            protect: bool = True,
+            protected_prompt: str = protected_translator_prompt,
+            max_validation_retries: int = 2,
+            max_unique_translations: int | None = None,
     ):
         self.model = model
         self.prompt = prompt
-        self.glossary = self._set_glossary(spreadsheet_path)
+        # Formulas, widgets, images and links are masked locally before the
+        # request and restored afterwards; see protect.MaskedText.
+        self.protect = protect
+        self.protected_prompt = protected_prompt
+        self.glossary = load_glossary(spreadsheet_path)
         self.max_retry = 3
-        self.lock = asyncio.Lock()
+        self.max_rate_limit_retries = 10
+        self.max_generated_tokens = 300
+        # Extra single requests for a text whose translation fails validation.
+        self.max_validation_retries = max_validation_retries
+        # Bound on the session's deduplication cache (least recently used texts
+        # go first); None keeps every text for the whole session.
+        self.max_unique_translations = max_unique_translations
+        self.encoding = get_encoding(model)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        # Caps the number of chat completions in flight across every batch
+        # that shares this translator.
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
         self.client = client
+        self.memory = memory
+        self.metrics = metrics if metrics is not None else METRICS
+        # Short texts are packed into shared requests of up to `pack_tokens`
+        # source tokens; 0 sends every text on its own.
+        self.pack_tokens = min(pack_tokens, self.MAX_TOKENS_PER_REQUEST // 2)
+        self.pack_window = pack_window
+        self.max_packed_text_tokens = self.pack_tokens // 4
+        if memory is not None:
+            self.memory_context = TranslationMemory.make_context(
+                self.model,
+                self.prompt,
+                self.protected_prompt if protect else None,
+                self.glossary.render(),
+            )
 
+        self._reset()
         logger.info(f"Translator initialized with model: {self.model}")
 
-    def _set_glossary(self, glossary_path: str):
-        logger.info(f"Loading glossary from {glossary_path}")
-        glossary = (
-            pd.read_csv(glossary_path, index_col=0, usecols=[0, 1])
-            .dropna()
-            .to_string(formatters={"UKR": "- {}".format})
-        )
-        self.glossary = glossary
-        logger.info("Glossary loaded successfully")
-
-    def __enter__(self) -> Self:
+    def _reset(self):
         self.token_usage_prompt = 0
         self.token_usage_generated = 0
         self.n_api_requests = 0
+        self.n_cache_hits = 0
+        self.n_deduplicated = 0
+        self.n_skipped = 0
+        self.n_validation_retries = 0
+        self.n_invalid = 0
+        # One task per unique normalized text for the whole session, so copies
+        # of a string, within a file or across files, share a single request.
+        self._unique_translations: OrderedDict[str, asyncio.Task | Translation] = OrderedDict()
+        self.n_packed = 0
+        self.n_pack_fallbacks = 0
+        self._pack: list[tuple[str, asyncio.Future]] = []
+        self._pack_size = 0
+        self._pack_timer: asyncio.TimerHandle | None = None
+        self._pack_tasks: set[asyncio.Task] = set()
         self.time = time.time()
+
+    def __enter__(self) -> Self:
+        self._reset()
         logger.info("Translation session started")
         return self
 
     def __exit__(self, *args):
         logger.info(
             f"Translation session ended. Requests made: {self.n_api_requests}, "
+            f"Cache hits: {self.n_cache_hits}, "
+            f"Requests saved by deduplication: {self.n_deduplicated}, "
+            f"Texts with nothing to translate: {self.n_skipped}, "
+            f"Texts sent packed: {self.n_packed} ({self.n_pack_fallbacks} packs fell back), "
+            f"Validation retries: {self.n_validation_retries}, "
+            f"Texts left fuzzy: {self.n_invalid}, "
             f"Tokens read: {self.token_usage_prompt}, "
-            f"Tokens generated: {self.token_usage_generated}"
+            f"Tokens generated: {self.token_usage_generated}, "
             f"Time taken: {(time.time()-self.time):2f} seconds"
         )
         
-    async def translate(self, text: str) -> None | str:
-        print("got text ",text)
-        messages = [
-            {"role": "system", "content": self.prompt.format(glossary=self.glossary)},
+    def messages(
+            self,
+            text: str,
+            packed: bool = False,
+            protected: bool = False,
+            terms_text: str | None = None,
+    ) -> List[dict]:
+        """Chat messages of the request that translates `text`."""
+        prompt = self.protected_prompt if protected else self.prompt
+        # Only the glossary rows whose terms occur in the text go into the prompt.
+        # Packed requests match terms on the raw texts (`terms_text`), since
+        # JSON escaping would glue `\n` onto the next word.
+        system_prompt = prompt.format(glossary=self.glossary.render(text if terms_text is None else terms_text))
+        if packed:
+            system_prompt += packing_prompt
+        return [
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": text},
         ]
-         
+
+    async def _complete(self, messages: List[dict], max_tokens: int | None = None, n_texts: int = 1) -> str:
+        max_tokens = max_tokens or self.max_generated_tokens
+        estimated_tokens = self.count_tokens(messages) + max_tokens
+
+        queued = started = time.perf_counter()
+        attempt = 0
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=300,
+            while True:
+                await self.rate_limiter.acquire(estimated_tokens)
+                try:
+                    async with self.semaphore:
+                        started = time.perf_counter()
+                        response = await self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=0.3,
+                            max_tokens=max_tokens,
+                        )
+                    break
+                except RateLimitError as e:
+                    # Retrying cannot help once the account is out of credit.
+                    if getattr(e, "code", None) == "insufficient_quota":
+                        raise
+                    if attempt >= self.max_rate_limit_retries:
+                        raise
+                    delay = self.rate_limiter.backoff(attempt, retry_after_seconds(e))
+                    attempt += 1
+                    logger.warning(
+                        f"Rate limited, re-queueing text (attempt {attempt}) after {delay:.1f} seconds"
+                    )
+        except Exception as e:
+            self.metrics.record_request(
+                RequestRecord(
+                    started - queued,
+                    time.perf_counter() - started,
+                    retries=attempt,
+                    texts=n_texts,
+                    error=type(e).__name__,
+                )
             )
-            print(text, "\n",response.choices[0].message.content, "\n$$$$$$$$$$$$$$$$$$$")
-            self.n_api_requests += 1
-            self.token_usage_prompt += response.usage.prompt_tokens
-            self.token_usage_generated += response.usage.completion_tokens
-        
-            return response.choices[0].message.content
-        except:
-            logger.error(f"FAILED TO GET RESPONSE. \nInput: {text} \nContent: {response}")
+            raise
+
+        # Queue wait covers the rate limiter, the concurrency cap and any backoff.
+        self.metrics.record_request(
+            RequestRecord(
+                queue_wait=started - queued,
+                latency=time.perf_counter() - started,
+                prompt_tokens=response.usage.prompt_tokens,
+                completion_tokens=response.usage.completion_tokens,
+                retries=attempt,
+                texts=n_texts,
+            )
+        )
+        self.rate_limiter.settle(estimated_tokens, response.usage.total_tokens)
+        self.n_api_requests += 1
+        self.token_usage_prompt += response.usage.prompt_tokens
+        self.token_usage_generated += response.usage.completion_tokens
+        usage = _request_usage.get()
+        if usage is not None:
+            usage.prompt_tokens += response.usage.prompt_tokens
+            usage.completion_tokens += response.usage.completion_tokens
+        return response.choices[0].message.content
+
+    async def _translate_text(self, text: str) -> str:
+        if self.protect:
+            masked = mask(text)
+            if masked.is_untranslatable:
+                return text
+            translated_text = masked.unmask(
+                await self._complete(self.messages(masked.text, protected=True))
+            )
+            if translated_text is not None:
+                return translated_text
+            logger.warning("Placeholders were not preserved, retrying without masking")
+        return await self._complete(self.messages(text))
+
+    async def translate(self, text: str) -> None | str:
+        try:
+            translated_text = await self._translate_text(text)
+        except Exception as e:
+            logger.error(f"FAILED TO GET RESPONSE. \nInput: {text} \nError: {e}")
+            translated_text = None
+        translation = await self.validated(text, translated_text)
+        if not translation.text:
+            return None
+        logger.debug(f"Translated '{text}' to '{translation.text}'")
+        return translation.text
+
+    async def _translate_one(self, text: str) -> str | None:
+        try:
+            return await self._translate_text(text)
+        except Exception as e:
+            logger.error(f"Error during translation: {e}")
         return None
-    
-    async def translate_batch(self, texts: List[str]) -> List[str]:
-        """Translate a batch of texts."""
-        logger.info(f"Translating a batch of {len(texts)} texts")
-
-        translated_texts = []
-
-        for text in texts:
-            messages = [
-                {"role": "system", "content": self.prompt.format(glossary=self.glossary)},
-                {"role": "user", "content": text},
-            ]
-
-            try:
-                # Translate each message individually
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.3,
-                    max_tokens=300,
-                )
 
-                # Extract the translated message
-                translated_text = response.choices[0].message.content
-                translated_texts.append(translated_text)
+    async def validated(self, text: str, translated_text: str | None) -> Translation:
+        """Check a translation against its source and re-send only the texts that fail.
 
-                # Track token usage
-                self.n_api_requests += 1
-                self.token_usage_prompt += response.usage.prompt_tokens
-                self.token_usage_generated += response.usage.completion_tokens
+        Gives up after `max_validation_retries` extra requests and returns the
+        last candidate with `ok=False`.
+        """
+        issues = validate(text, translated_text) if translated_text is not None else ["request failed"]
+        for _ in range(self.max_validation_retries):
+            if not issues:
+                break
+            logger.warning(f"Retrying '{text}': {'; '.join(issues)}")
+            self.n_validation_retries += 1
+            candidate = await self._translate_one(text)
+            if candidate is None:
+                continue
+            translated_text = candidate
+            issues = validate(text, translated_text)
 
-            except RateLimitError:
-                logger.warning("Rate limit exceeded. Retrying after cooldown...")
-                async with self.lock:
-                    await asyncio.sleep(30)
+        if issues:
+            self.n_invalid += 1
+            logger.error(f"Translation of '{text}' failed validation: {'; '.join(issues)}")
+            return Translation(translated_text or "", False)
+        return Translation(translated_text, True)
 
-            except Exception as e:
-                logger.error(f"Error during translation: {e}")
-                translated_texts.append("ERROR")
+    async def _translate_packed(self, texts: List[str]) -> List[str | None] | None:
+        """Translate several texts in one request.
 
+        Returns None if the answer doesn't fit the request, and None in place
+        of single texts whose placeholders could not be restored.
+        """
+        masked_texts = [mask(text) for text in texts] if self.protect else None
+        sent_texts = [masked.text for masked in masked_texts] if self.protect else texts
+        text_tokens = sum(len(self.encoding.encode(text)) for text in sent_texts)
+        max_tokens = min(self.MAX_TOKENS_PER_REQUEST, 2 * text_tokens + 10 * len(texts) + 50)
+        messages = self.messages(
+            json.dumps(sent_texts, ensure_ascii=False),
+            packed=True,
+            protected=self.protect,
+            terms_text="\n".join(sent_texts),
+        )
+        try:
+            content = await self._complete(messages, max_tokens, n_texts=len(texts))
+        except Exception as e:
+            logger.error(f"Error during packed translation: {e}")
+            return None
+
+        if not isinstance(content, str):
+            return None
+        content = content.strip()
+        if content.startswith("```"):
+            content = content.split("\n", 1)[-1].rsplit("```", 1)[0]
+        try:
+            translated_texts = json.loads(content)
+        except json.JSONDecodeError:
+            return None
+        if (
+            not isinstance(translated_texts, list)
+            or len(translated_texts) != len(texts)
+            or not all(isinstance(text, str) for text in translated_texts)
+        ):
+            return None
+        if self.protect:
+            return [masked.unmask(text) for masked, text in zip(masked_texts, translated_texts)]
         return translated_texts
 
-    async def translate_entry_batch(self, entries: List[polib.POEntry]):
-        logger.info(f"Starting translation for a batch of {len(entries)} entries")
-        texts = [entry.msgid for entry in entries]
-        translated_texts = await self.translate_batch(texts)
+    async def _translate_group(self, group: List[tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in group]
+        translated_texts = [None] * len(texts)
+        try:
+            if len(texts) > 1:
+                packed_texts = await self._translate_packed(texts)
+                if packed_texts is None:
+                    self.n_pack_fallbacks += 1
+                    logger.warning(f"Packed answer for {len(texts)} texts did not match, sending them one by one")
+                else:
+                    self.n_packed += len(texts)
+                    translated_texts = packed_texts
 
-        for entry, translated_text in zip(entries, translated_texts):
-            entry.msgstr = translated_text
-            logger.info(f"Translated entry: '{entry.msgid}' to '{entry.msgstr}'")
+            # Texts the pack could not deliver are sent on their own.
+            missing = [position for position, text in enumerate(translated_texts) if text is None]
+            for position, text in zip(
+                missing, await asyncio.gather(*(self._translate_one(texts[position]) for position in missing))
+            ):
+                translated_texts[position] = text
+        finally:
+            # Nobody awaits this task, so every waiting text must get an answer, even on errors.
+            for (_, future), translated_text in zip(group, translated_texts):
+                if not future.done():
+                    future.set_result(translated_text)
 
-        return entries
+    def _flush_pack(self):
+        if self._pack_timer is not None:
+            self._pack_timer.cancel()
+            self._pack_timer = None
+        group, self._pack, self._pack_size = self._pack, [], 0
+        if group:
+            # Keep a reference so the task isn't garbage-collected while in flight.
+            task = asyncio.ensure_future(self._translate_group(group))
+            self._pack_tasks.add(task)
+            task.add_done_callback(self._pack_tasks.discard)
 
-    def estimate_usage(self, entry: polib.POFile):
-        encoding = tiktoken.encoding_for_model(self.model)
-        text = entry.msgstr
-        messages = [
-            {"role": "system", "content": self.prompt},
-            {"role": "user", "content": text},
-        ]
+    def _submit_packed(self, text: str, n_tokens: int) -> asyncio.Future:
+        """Queue a short text for the next packed request.
+
+        A pack is sent as soon as it reaches the token budget, or after
+        `pack_window` seconds so texts from concurrent batches can join it.
+        """
+        if self._pack_size + n_tokens > self.pack_tokens:
+            self._flush_pack()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pack.append((text, future))
+        self._pack_size += n_tokens
+        if self._pack_timer is None:
+            self._pack_timer = loop.call_later(self.pack_window, self._flush_pack)
+        return future
+
+    def known_translation(self, text: str) -> Translation | None:
+        """Translation that needs no request: texts with nothing to translate and memory hits."""
+        if self.protect and mask(text).is_untranslatable:
+            # Pure formulas, widgets or links come back unchanged without an API call.
+            self.n_skipped += 1
+            return Translation(text, True)
+
+        if self.memory is not None:
+            cached = self.memory.get(TranslationMemory.make_key(text, self.memory_context))
+            self.metrics.record_cache(cached is not None)
+            if cached is not None:
+                self.n_cache_hits += 1
+                return Translation(cached, True)
+        return None
+
+    def remember(self, text: str, translation: Translation):
+        """Store a translation that passed validation in the translation memory."""
+        if self.memory is not None and translation.ok:
+            self.memory.put(TranslationMemory.make_key(text, self.memory_context), translation.text)
+
+    async def _translate_unique(self, text: str) -> Translation:
+        known = self.known_translation(text)
+        if known is not None:
+            return known
+
+        sent_text = mask(text).text if self.protect else text
+        n_tokens = len(self.encoding.encode(sent_text)) if self.pack_tokens else 0
+        if self.pack_tokens and n_tokens <= self.max_packed_text_tokens:
+            translated_text = await self._submit_packed(text, n_tokens)
+        else:
+            translated_text = await self._translate_one(text)
+
+        translation = await self.validated(text, translated_text)
+        self.remember(text, translation)
+        return translation
+
+    async def _translate_deduplicated(self, text: str) -> Translation:
+        normalized = text.strip()
+        if not normalized:
+            return Translation(text, True)
+
+        task = self._unique_translations.get(normalized)
+        if task is None:
+            task = asyncio.ensure_future(self._translate_unique(normalized))
+            self._unique_translations[normalized] = task
+            if self.max_unique_translations is not None:
+                while len(self._unique_translations) > self.max_unique_translations:
+                    # An evicted text still in flight keeps its task for the copies already waiting on it.
+                    self._unique_translations.popitem(last=False)
+        else:
+            self.n_deduplicated += 1
+            self._unique_translations.move_to_end(normalized)
+        if isinstance(task, Translation):
+            translation = task
+        else:
+            translation = await task
+            if not translation.text:
+                # Let the next copy of this text try again instead of reusing the failure.
+                if self._unique_translations.get(normalized) is task:
+                    del self._unique_translations[normalized]
+                return translation
+            # Finished texts keep only their result, so long sessions stay small.
+            if self._unique_translations.get(normalized) is task:
+                self._unique_translations[normalized] = translation
+
+        return with_whitespace_of(text, translation)
+
+    async def translate_texts(self, texts: List[str]) -> List[Translation]:
+        """Translate a batch of texts concurrently, keeping the input order.
+
+        Must be called inside a `with translator:` session, which holds the
+        deduplication state.
+        """
+        logger.debug(f"Translating a batch of {len(texts)} texts")
+        return list(await asyncio.gather(*(self._translate_deduplicated(text) for text in texts)))
+
+    async def translate_batch(self, texts: List[str]) -> List[str]:
+        """Like `translate_texts`, but only the texts; empty for texts that could not be translated."""
+        return [translation.text for translation in await self.translate_texts(texts)]
+
+    async def translate_entry_batch(self, entries: List[polib.POEntry]) -> List[polib.POEntry]:
+        """Translate entries in place and return the ones that got a translation.
+
+        Translations that still fail validation after the retries are stored
+        with the fuzzy flag for a reviewer; entries whose requests failed
+        keep their previous msgstr.
+        """
+        logger.debug(f"Starting translation for a batch of {len(entries)} entries")
+        translations = await self.translate_texts([entry.msgid for entry in entries])
+
+        updated = []
+        for entry, translation in zip(entries, translations):
+            if apply_translation(entry, translation):
+                updated.append(entry)
+                logger.debug(f"Translated entry: '{entry.msgid}' to '{entry.msgstr}'")
+
+        return updated
+
+    def count_tokens(self, messages: List[dict]) -> int:
         tokens_per_message = 4
         tokens_per_name = 1
         num_tokens = 0
         for message in messages:
             num_tokens += tokens_per_message
             for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
+                num_tokens += len(self.encoding.encode(value))
                 if key == "name":
                     num_tokens += tokens_per_name
         num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
         return num_tokens
-    
\ No newline at end of file
+
+    def estimate_usage(self, entry: polib.POEntry) -> int:
+        """Prompt tokens of the request that would translate `entry`."""
+        return self.count_tokens(self.messages(entry.msgid))
@@ -1,18 +1,48 @@
+import asyncio
+import sys
 from os import environ, path
 
 import gradio as gr
 from loguru import logger
 
-from read_pot import estimate_pofile, translate_pofile, translate_text_entry
+from jobs import DONE, JobQueue
+from metrics import METRICS
+from read_pot import estimate_pofile, translate_text_entry
 
+# Log from a background thread so slow terminals don't stall request handlers.
+logger.remove()
+logger.add(sys.stderr, level="INFO", enqueue=True)
 
-async def process_file(api_key: str, input_file: str):
+# Shared by every browser session; files are translated in the background.
+JOBS = JobQueue(max_jobs=int(environ.get("PO_TRANSLATOR_MAX_JOBS", 2)))
+
+
+def submit_file(api_key: str, input_file: str, incremental: bool):
+    if not input_file:
+        raise gr.Error("Please upload a .po file.")
     output_path = path.join(
         path.split(input_file)[0], "UA_translated_" + path.split(input_file)[-1]
     )
-    tokens = await translate_pofile(input_file, output_path, api_key)
-    logger.info("File finished!")
-    return output_path, tokens
+    return JOBS.submit(api_key, input_file, output_path, incremental).id
+
+
+async def watch_job(job_id: str):
+    """Stream a job's progress until it finishes, then offer the result."""
+    while True:
+        job = JOBS.get(job_id)
+        if job is None:
+            raise gr.Error(f"Unknown job: {job_id}")
+        if job.is_finished:
+            yield job.describe(), job.output_path if job.status == DONE else None, job.stats or None
+            return
+        yield job.describe(), None, None
+        await asyncio.sleep(1)
+
+
+def cancel_job(job_id: str):
+    if not JOBS.cancel(job_id):
+        raise gr.Error(f"Job {job_id} is not running.")
+    return f"Job {job_id}: cancelling"
 
 
 async def process_text(api_key: str, input_text: str):
@@ -27,18 +57,32 @@ with gr.Blocks() as demo:
     with gr.Tab(label="Translate .po file"):
         api_key = gr.Text(label="OpenAI API Key", type="password")
         input_file = gr.File()
+        incremental = gr.Checkbox(label="Only translate untranslated and fuzzy entries")
         translate_po_button = gr.Button(value="Translate")
+        job_id = gr.Text(label="Job ID", info="Paste the ID of an earlier job to follow it or download its result")
+        with gr.Row():
+            watch_button = gr.Button(value="Show progress")
+            cancel_button = gr.Button(value="Cancel")
+        progress = gr.Textbox(label="Progress")
         output_file = gr.File()
         tokens = gr.Textbox(label="Tokens Used")
 
         translate_po_button.click(
-            process_file, inputs=[api_key, input_file], outputs=[output_file, tokens]
+            submit_file,
+            inputs=[api_key, input_file, incremental],
+            outputs=[job_id],
+        ).then(
+            watch_job, inputs=[job_id], outputs=[progress, output_file, tokens]
+        )
+        watch_button.click(
+            watch_job, inputs=[job_id], outputs=[progress, output_file, tokens]
         )
+        cancel_button.click(cancel_job, inputs=[job_id], outputs=[progress])
 
         estimate_button = gr.Button(value="Estimate")
-        estimated_tokens = gr.Text(label="Estimated read usage")
+        estimated_tokens = gr.Text(label="Estimate (requests, tokens, cost in USD, seconds)")
         estimate_button.click(
-            estimate_pofile, inputs=[api_key, input_file], outputs=[estimated_tokens]
+            estimate_pofile, inputs=[input_file], outputs=[estimated_tokens]
         )
 
     with gr.Tab(label="Translate text chunck"):
@@ -53,5 +97,14 @@ with gr.Blocks() as demo:
             process_text, inputs=[api_key, input_text], outputs=[output_text, tokens]
         )
 
+    with gr.Tab(label="Metrics"):
+        refresh_metrics_button = gr.Button(value="Refresh")
+        metrics_json = gr.JSON()
+        metrics_text = gr.Code(label="Prometheus")
+        refresh_metrics_button.click(
+            lambda: (METRICS.to_json(), METRICS.to_prometheus()),
+            outputs=[metrics_json, metrics_text],
+        )
+
 
-demo.launch(server_name="0.0.0.0")
+demo.queue(default_concurrency_limit=None).launch(server_name="0.0.0.0")
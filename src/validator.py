@@ -0,0 +1,66 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+COMMAND_PATTERN = re.compile(r"\\[a-zA-Z]+")
+DOLLAR_PATTERN = re.compile(r"(?<!\\)\$")
+WIDGET_PATTERN = re.compile(r"\[\[☃[^\]]*\]\]")
+IMAGE_PATTERN = re.compile(r"!\[[^\]]*\]\(([^)]*)\)")
+# printf-style markers as used by python-format/c-format entries. A space flag
+# is left out on purpose so prose like "50% of" doesn't count.
+PRINTF_PATTERN = re.compile(r"%(?:\(\w+\))?[-#0+]*\d*(?:\.\d+)?[diouxXeEfFgGcrs]")
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """The parts of a text a translation must carry over unchanged."""
+
+    open_braces: int
+    close_braces: int
+    backslashes: int
+    dollars: int
+    commands: Counter
+    images: Counter
+    placeholders: Counter
+
+
+def fingerprint(text: str) -> Fingerprint:
+    return Fingerprint(
+        open_braces=text.count("{"),
+        close_braces=text.count("}"),
+        backslashes=text.count("\\"),
+        dollars=len(DOLLAR_PATTERN.findall(text)),
+        commands=Counter(COMMAND_PATTERN.findall(text)),
+        images=Counter(WIDGET_PATTERN.findall(text) + IMAGE_PATTERN.findall(text)),
+        placeholders=Counter(PRINTF_PATTERN.findall(text)),
+    )
+
+
+def _describe(name: str, expected: Counter, found: Counter) -> str:
+    missing = ", ".join(sorted((expected - found).elements()))
+    extra = ", ".join(sorted((found - expected).elements()))
+    return f"{name} differ (missing: {missing or '-'}; extra: {extra or '-'})"
+
+
+def validate(source: str, translation: str) -> List[str]:
+    """List what `translation` broke compared to `source`; empty when it looks structurally intact."""
+    if source.strip() and not translation.strip():
+        return ["empty translation"]
+
+    expected = fingerprint(source)
+    found = fingerprint(translation)
+    issues = []
+    if (expected.open_braces, expected.close_braces) != (found.open_braces, found.close_braces):
+        issues.append(
+            f"braces differ ({expected.open_braces}/{expected.close_braces} "
+            f"vs {found.open_braces}/{found.close_braces})"
+        )
+    if expected.backslashes != found.backslashes:
+        issues.append(f"backslash count differs ({expected.backslashes} vs {found.backslashes})")
+    if expected.dollars != found.dollars:
+        issues.append(f"$ count differs ({expected.dollars} vs {found.dollars})")
+    for name in ("commands", "images", "placeholders"):
+        if getattr(expected, name) != getattr(found, name):
+            issues.append(_describe(name, getattr(expected, name), getattr(found, name)))
+    return issues